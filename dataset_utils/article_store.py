@@ -0,0 +1,211 @@
+"""Columnar article store: Parquet files partitioned by year, read with date filters and column projection"""
+import csv
+from datetime import datetime
+import os
+from pathlib import Path
+import shutil
+import sys
+from typing import Dict, Iterator, List, Optional
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from dataset_utils.parse_date import parse_date_key
+from parsers.saving_to_csv import prepare_csv
+
+
+csv.field_size_limit(sys.maxsize)
+
+
+def check_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("The article store needs pyarrow, install it with `pip install pyarrow`.")
+
+
+def is_article_store(path: str | Path) -> bool:
+    """Checks if the path is an article store, i.e. a directory with year partitions of Parquet files"""
+    return os.path.isdir(path) and any(Path(path).glob("year=*/*.parquet"))
+
+
+def get_store_years(store_path: str | Path) -> List[int]:
+    """Returns years of the partitions of the store"""
+    return sorted(int(path.name.split("=")[1]) for path in Path(store_path).iterdir()
+                  if path.is_dir() and path.name.startswith("year="))
+
+
+class ArticleStoreWriter:
+    """
+    Writes articles to the store at store_path as Parquet files in year=YYYY directories, one file per year
+    for each writer. Rows are buffered and written in row groups of row_group_size rows, so Parquet statistics
+    on the date column let readers skip row groups. Dates are stored as '%Y-%m-%d' strings, rows without a
+    valid date are skipped. Every column is stored as a string.
+    The store must not have partitions yet, with overwrite they are removed first, so writing it again
+    replaces the articles instead of adding them once more.
+    """
+    def __init__(self, store_path: str | Path, fieldnames: List[str], row_group_size: int = 10_000,
+                 compression: str = "zstd", overwrite: bool = False):
+        check_pyarrow()
+        if 'date' not in fieldnames:
+            raise ValueError("Fieldnames must have 'date' column.")
+
+        partition_paths = list(Path(store_path).glob("year=*"))
+        if partition_paths and not overwrite:
+            raise FileExistsError(f"Article store {store_path} is not empty. Set overwrite to replace it.")
+        for partition_path in partition_paths:
+            shutil.rmtree(partition_path)
+
+        self.store_path = Path(store_path)
+        self.fieldnames = fieldnames
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = pa.schema([(fieldname, pa.string()) for fieldname in fieldnames])
+        self.file_id = uuid.uuid4().hex
+        self.buffers = {}
+        self.writers = {}
+        self.skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def writerow(self, article: Dict[str, str]) -> None:
+        try:
+            date = parse_date_key(article.get('date') or '')
+        except ValueError:
+            self.skipped += 1
+            return
+
+        row = {fieldname: article.get(fieldname) for fieldname in self.fieldnames}
+        row['date'] = date
+        year = int(date[:4])
+        buffer = self.buffers.setdefault(year, [])
+        buffer.append(row)
+        if len(buffer) >= self.row_group_size:
+            self.flush(year)
+
+    def writerows(self, articles: List[Dict[str, str]]) -> None:
+        for article in articles:
+            self.writerow(article)
+
+    def flush(self, year: int) -> None:
+        """Write buffered rows of the year as one row group."""
+        buffer = self.buffers.pop(year, None)
+        if not buffer:
+            return
+
+        if year not in self.writers:
+            partition_path = self.store_path / f"year={year}"
+            partition_path.mkdir(parents=True, exist_ok=True)
+            self.writers[year] = pq.ParquetWriter(partition_path / f"part-{self.file_id}.parquet", self.schema,
+                                                  compression=self.compression)
+        self.writers[year].write_table(pa.Table.from_pylist(buffer, schema=self.schema))
+
+    def close(self) -> None:
+        for year in list(self.buffers):
+            self.flush(year)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def get_date_filter(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """Returns a filter on the year partitions and the date column for dates between start_date and end_date"""
+    expression = None
+    if start_date:
+        start_date = parse_date_key(start_date)
+        expression = (ds.field("year") >= int(start_date[:4])) & (ds.field("date") >= start_date)
+    if end_date:
+        end_date = parse_date_key(end_date)
+        end_expression = (ds.field("year") <= int(end_date[:4])) & (ds.field("date") <= end_date)
+        expression = end_expression if expression is None else expression & end_expression
+    return expression
+
+
+def read_articles(store_path: str | Path, columns: Optional[List[str]] = None, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None, batch_size: int = 10_000) -> Iterator[Dict[str, str]]:
+    """
+    Yields articles of the store dated between start_date and end_date as dicts with the given columns.
+    Only the partitions and row groups that can hold these dates and only the given columns are read.
+    Years come in ascending order. Articles of a part file come in the order they were written, but part files
+    of a year are read in the order of their names, which are random, so articles of several writers are not
+    in the order they were written.
+    """
+    check_pyarrow()
+    dataset = ds.dataset(store_path, format="parquet", partitioning="hive")
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != "year"]
+
+    scanner = dataset.scanner(columns=columns, filter=get_date_filter(start_date, end_date), batch_size=batch_size)
+    for batch in scanner.to_batches():
+        yield from batch.to_pylist()
+
+
+def read_texts(store_path: str | Path, start_date: Optional[str] = None,
+               end_date: Optional[str] = None) -> Iterator[str]:
+    """Yields texts of the articles between start_date and end_date, reading only the text column"""
+    for article in read_articles(store_path, ["text"], start_date, end_date):
+        yield article["text"] or ""
+
+
+def read_dataset_rows(path: str | Path, columns: Optional[List[str]] = None, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """
+    Yields rows of a csv dataset or of an article store. For a store dates are filtered while reading,
+    for a csv file rows are filtered after parsing, rows without a valid date are then skipped too.
+    """
+    if is_article_store(path):
+        yield from read_articles(path, columns, start_date, end_date)
+        return
+
+    start_date = parse_date_key(start_date) if start_date else None
+    end_date = parse_date_key(end_date) if end_date else None
+
+    with open(path, "r", encoding='utf-8') as file:
+        for row in csv.DictReader(file, delimiter=',', quotechar='"'):
+            if start_date or end_date:
+                try:
+                    date = parse_date_key(row['date'])
+                except ValueError:
+                    continue
+                if (start_date and date < start_date) or (end_date and date > end_date):
+                    continue
+            yield {column: row[column] for column in columns} if columns else row
+
+
+def convert_csv_to_store(filenames: List[str | Path], store_path: str | Path, fieldnames: List[str],
+                         overwrite: bool = False) -> None:
+    """Writes articles of the csv datasets to a new store, with overwrite the store is replaced"""
+    with ArticleStoreWriter(store_path, fieldnames, overwrite=overwrite) as writer:
+        for filename in filenames:
+            writer.writerows(read_dataset_rows(filename, fieldnames))
+
+    if writer.skipped:
+        print(f"Skipped {writer.skipped} rows without a valid date.")
+
+
+def export_store_to_csv(store_path: str | Path, output_filename: str | Path, fieldnames: List[str],
+                        start_date: Optional[str] = None, end_date: Optional[str] = None) -> None:
+    """Writes articles of the store between start_date and end_date to a csv dataset"""
+    prepare_csv(output_filename, fieldnames)
+    with open(output_filename, "a", encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writerows(read_articles(store_path, fieldnames, start_date, end_date))
+
+
+if __name__ == "__main__":
+    from constants import ROOT_PATH
+
+    for source, fieldnames in (("kommersant", ["date", "title", "text", "topic"]),
+                               ("lenta", ["date", "title", "text", "topic", "subtopic"]),
+                               ("ria", ["date", "title", "text", "source", "topics"])):
+        filenames = [ROOT_PATH / "parsers" / f"{source}_dataset" / f"{source}_{year}.csv"
+                     for year in range(2000, datetime.now().year + 1)]
+        convert_csv_to_store([filename for filename in filenames if os.path.isfile(filename)],
+                             ROOT_PATH / "parsers" / "article_store" / source, fieldnames, overwrite=True)
@@ -1,8 +1,15 @@
-"""Script that removes duplicates from dataset"""
+"""Script that removes duplicates and near-duplicates from datasets"""
 import csv
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+from typing import List, Tuple
 from pathlib import Path
 import sys
+import tempfile
+import zlib
+
+import numpy as np
 
 
 csv.field_size_limit(sys.maxsize)
@@ -25,6 +32,201 @@ def remove_duplicate_rows(filename: str | Path, fieldnames: List[str], output_fi
     save_to_csv(articles_info, output_filename)
 
 
+MERSENNE_PRIME = (1 << 31) - 1
+EMPTY_SIGNATURE_VALUE = MERSENNE_PRIME  # minhash values are below the prime, so it marks texts without shingles
+WORD_RE = re.compile(r'\w+')
+
+
+def get_shingle_hashes(text: str, shingle_size: int = 5) -> np.ndarray:
+    """Returns crc32 hashes of the word shingles of the text, a text shorter than shingle_size is one shingle"""
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+
+    shingles = {' '.join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))}
+    return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64,
+                       count=len(shingles))
+
+
+def get_permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns coefficients of the hash functions (a * x + b) mod MERSENNE_PRIME"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def compute_minhash_signatures(shingle_hashes: List[np.ndarray], a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Returns MinHash signatures of texts given by their shingle hashes, one row per text.
+    Crc32 hashes are below 2 ** 32 and coefficients below 2 ** 31, so a * x + b does not overflow uint64.
+    """
+    signatures = np.full((len(shingle_hashes), len(a)), EMPTY_SIGNATURE_VALUE, dtype=np.uint32)
+    not_empty = [i for i, hashes in enumerate(shingle_hashes) if len(hashes)]
+    if not not_empty:
+        return signatures
+
+    hashes = np.concatenate([shingle_hashes[i] for i in not_empty])
+    starts = np.cumsum([0] + [len(shingle_hashes[i]) for i in not_empty[:-1]])
+    permuted = (hashes[:, None] * a[None, :] + b[None, :]) % MERSENNE_PRIME
+    signatures[not_empty] = np.minimum.reduceat(permuted, starts, axis=0)
+    return signatures
+
+
+def write_signatures(filename: str | Path, text_field: str, signatures_filename: str, num_perm: int = 128,
+                     shingle_size: int = 5, seed: int = 1, max_batch_shingles: int = 50_000) -> int:
+    """
+    Streams the dataset and appends MinHash signatures of its texts to signatures_filename as uint32 rows.
+    :return: number of rows in the dataset
+    """
+    a, b = get_permutations(num_perm, seed)
+    rows_count = 0
+    batch = []
+    batch_shingles = 0
+
+    with open(filename, "r", encoding='utf-8') as file, open(signatures_filename, "wb") as signatures_file:
+        for row in csv.DictReader(file, delimiter=',', quotechar='"'):
+            shingle_hashes = get_shingle_hashes(row[text_field] or '', shingle_size)
+            batch.append(shingle_hashes)
+            batch_shingles += len(shingle_hashes)
+            rows_count += 1
+
+            if batch_shingles >= max_batch_shingles:
+                signatures_file.write(compute_minhash_signatures(batch, a, b).tobytes())
+                batch = []
+                batch_shingles = 0
+
+        if batch:
+            signatures_file.write(compute_minhash_signatures(batch, a, b).tobytes())
+
+    return rows_count
+
+
+def find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def find_duplicate_clusters(signatures: np.ndarray, bands: int = 16, threshold: float = 0.8,
+                            chunk_size: int = 100_000) -> np.ndarray:
+    """
+    Groups texts whose MinHash signatures agree in at least threshold of positions, using LSH:
+    texts are compared only if all rows of one of the bands of their signatures are equal.
+    Memory holds one band of keys for all texts at a time.
+    :return: for every text the index of the first text of its cluster
+    """
+    texts_count, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    multipliers = np.random.default_rng(0).integers(1, 1 << 63, size=rows_per_band, dtype=np.uint64) | np.uint64(1)
+    parent = np.arange(texts_count, dtype=np.int64)
+
+    with tempfile.TemporaryDirectory() as keys_directory_path:
+        band_keys = np.lib.format.open_memmap(os.path.join(keys_directory_path, 'band_keys.npy'), mode='w+',
+                                              dtype=np.uint64, shape=(bands, texts_count))
+        for start in range(0, texts_count, chunk_size):
+            chunk = signatures[start:start + chunk_size, :bands * rows_per_band].astype(np.uint64)
+            chunk = chunk.reshape(len(chunk), bands, rows_per_band)
+            band_keys[:, start:start + chunk_size] = (chunk * multipliers).sum(axis=2).T
+
+        not_empty = np.flatnonzero(signatures[:, 0] != EMPTY_SIGNATURE_VALUE)
+        for band in range(bands):
+            keys = band_keys[band][not_empty]
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+            starts = np.concatenate([[0], boundaries])
+            ends = np.concatenate([boundaries, [len(keys)]])
+
+            for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+                members = not_empty[order[start:end]]
+                first = members[0]
+                similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+                for member in members[1:][similarity >= threshold]:
+                    first_root, member_root = find(parent, first), find(parent, member)
+                    if first_root != member_root:
+                        parent[max(first_root, member_root)] = min(first_root, member_root)
+
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def remove_near_duplicate_rows(filenames: List[str | Path], fieldnames: List[str], output_directory_path: str | Path,
+                               text_field: str = 'text', threshold: float = 0.8, num_perm: int = 128,
+                               bands: int = 16, shingle_size: int = 5, processes: int = None,
+                               report_filename: str | Path = None, seed: int = 1) -> None:
+    """
+    Removes near-duplicate articles across all datasets with MinHash signatures of text shingles and LSH.
+    Signatures of the datasets are computed in parallel and kept on disk, so memory does not depend on
+    the size of the datasets. Of every cluster of near-duplicates only the first article in the order of
+    filenames is kept, each dataset is written to output_directory_path under its own name.
+    If report_filename is given, all articles of the clusters are listed there.
+    """
+    with tempfile.TemporaryDirectory() as signatures_directory_path:
+        signatures_filenames = [os.path.join(signatures_directory_path, f"{i}.u32") for i in range(len(filenames))]
+        with ProcessPoolExecutor(processes) as executor:
+            rows_counts = list(executor.map(write_signatures, filenames, [text_field] * len(filenames),
+                                            signatures_filenames, [num_perm] * len(filenames),
+                                            [shingle_size] * len(filenames), [seed] * len(filenames)))
+
+        all_signatures_filename = os.path.join(signatures_directory_path, "all.u32")
+        with open(all_signatures_filename, "wb") as all_signatures_file:
+            for signatures_filename in signatures_filenames:
+                with open(signatures_filename, "rb") as signatures_file:
+                    while block := signatures_file.read(1 << 24):
+                        all_signatures_file.write(block)
+                os.remove(signatures_filename)
+
+        if sum(rows_counts):
+            signatures = np.memmap(all_signatures_filename, dtype=np.uint32, mode='r',
+                                   shape=(sum(rows_counts), num_perm))
+            clusters = find_duplicate_clusters(signatures, bands, threshold)
+            del signatures
+        else:
+            clusters = np.zeros(0, dtype=np.int64)
+
+    cluster_sizes = np.bincount(clusters, minlength=len(clusters))
+    report_file = open(report_filename, "w", encoding='utf-8') if report_filename else None
+    report_writer = csv.writer(report_file) if report_file else None
+    if report_writer:
+        report_writer.writerow(["cluster", "filename", "row", "date", "title", "kept"])
+
+    try:
+        index = 0
+        for filename in filenames:
+            output_filename = Path(output_directory_path) / Path(filename).name
+            prepare_csv(output_filename, fieldnames)
+
+            with open(filename, "r", encoding='utf-8') as file, open(output_filename, "a", encoding='utf-8') as output:
+                writer = csv.DictWriter(output, fieldnames=fieldnames)
+                for row_number, row in enumerate(csv.DictReader(file, delimiter=',', quotechar='"')):
+                    cluster = clusters[index]
+                    if cluster == index:
+                        writer.writerow({fieldname: row[fieldname] for fieldname in fieldnames})
+                    if report_writer and cluster_sizes[cluster] > 1:
+                        report_writer.writerow([cluster, Path(filename).name, row_number, row.get("date"),
+                                                row.get("title"), cluster == index])
+                    index += 1
+    finally:
+        if report_file:
+            report_file.close()
+
+    duplicates = int(np.count_nonzero(clusters != np.arange(len(clusters))))
+    print(f"Articles: {len(clusters)}, near-duplicates removed: {duplicates}, "
+          f"clusters: {int(np.count_nonzero(cluster_sizes > 1))}")
+
+
 if __name__ == "__main__":
     for filename in Path(ROOT_PATH / 'parsers' / 'ria_dataset' / 'v2').iterdir():
         remove_duplicate_rows(filename, ["date", "title", "text", "source", "topics"], ROOT_PATH / 'parsers' / 'ria_dataset' / 'v2_clean' / filename.name)
+
+    remove_near_duplicate_rows(sorted(Path(ROOT_PATH / 'parsers' / 'ria_dataset' / 'v2_clean').iterdir()),
+                               ["date", "title", "text", "source", "topics"],
+                               ROOT_PATH / 'parsers' / 'ria_dataset' / 'v2_dedup',
+                               report_filename=ROOT_PATH / 'parsers' / 'ria_dataset' / 'duplicate_clusters.csv')
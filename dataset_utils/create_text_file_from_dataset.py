@@ -3,12 +3,20 @@ import csv
 from pathlib import Path
 import sys
 
+from dataset_utils.article_store import is_article_store, read_texts
+
 
 csv.field_size_limit(sys.maxsize)
 
 
 def create_text_file_from_dataset(filename: str | Path, output_filename: str | Path) -> None:
-    """Creates a .txt file from .csv dataset"""
+    """Creates a .txt file from .csv dataset or article store"""
+    if is_article_store(filename):
+        with open(output_filename, "w", encoding='utf-8') as output_file:
+            for text in read_texts(filename):
+                output_file.write(text)
+        return
+
     with open(filename, "r", encoding='utf-8') as file:
         reader = csv.DictReader(file, delimiter=',', quotechar='"')
         with open(output_filename, "w", encoding='utf-8') as output_file:
@@ -17,7 +25,10 @@ def create_text_file_from_dataset(filename: str | Path, output_filename: str | P
 
 
 def read_text_file_from_dataset(filename: str | Path) -> str:
-    """Reads a .txt file from .csv dataset"""
+    """Reads a .txt file from .csv dataset or article store"""
+    if is_article_store(filename):
+        return ' '.join(read_texts(filename))
+
     text = []
 
     with open(filename, "r", encoding='utf-8') as file:
@@ -1,11 +1,15 @@
 """Script to create datasets for each year from datasets with various dates"""
 import csv
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Tuple
 from pathlib import Path
+import shutil
 import sys
+import tempfile
 
-from parsers.saving_to_csv import save_to_csv, prepare_csv
+from dataset_utils.article_store import export_store_to_csv, is_article_store
+from parsers.saving_to_csv import prepare_csv
 
 from constants import ROOT_PATH
 
@@ -49,22 +53,97 @@ def get_dataset_names_for_year(directory_path: str | Path, year: int, is_sorted:
     return dataset_names
 
 
+def get_datasets_years(directory_path: str | Path) -> List[Tuple[str, int, int]]:
+    """Returns names of valid datasets in the directory with years of their start and end dates,
+    sorted by start date"""
+    datasets = []
+    for filename in Path(directory_path).iterdir():
+        if not validate_dataset_name(filename.name):
+            continue
+
+        start_date = datetime.strptime(filename.name.split("_")[1], "%Y-%m-%d")
+        end_date = datetime.strptime(filename.name.split("_")[3].replace(".csv", ""), "%Y-%m-%d")
+        datasets.append((start_date, filename.name, start_date.year, end_date.year))
+
+    datasets.sort(key=lambda dataset: dataset[0])
+    return [(dataset_name, start_year, end_year) for _, dataset_name, start_year, end_year in datasets]
+
+
+def partition_dataset(dataset_filename: str | Path, years: List[int], fieldnames: List[str],
+                      parts_directory_path: str | Path, part_prefix: str) -> Dict[int, str]:
+    """
+    Writes rows of the dataset dated in one of the years to part files without header, one per year.
+    :return: part filenames by year
+    """
+    part_filenames = {}
+    part_files = {}
+
+    try:
+        with open(dataset_filename, "r", encoding='utf-8') as file:
+            for article in csv.DictReader(file):
+                if not article['date']:
+                    continue
+                year = datetime.strptime(article['date'], "%Y-%m-%d").year
+                if year not in years:
+                    continue
+
+                if year not in part_files:
+                    part_filenames[year] = str(Path(parts_directory_path) / f"{part_prefix}_{year}.csv")
+                    part_file = open(part_filenames[year], "w", encoding='utf-8')
+                    part_files[year] = (part_file, csv.DictWriter(part_file, fieldnames=fieldnames))
+                part_files[year][1].writerow(article)
+    finally:
+        for part_file, _ in part_files.values():
+            part_file.close()
+
+    return part_filenames
+
+
+def create_yearly_datasets(directory_path: str | Path, years: List[int], fieldnames: List[str],
+                           output_directory_path: str | Path, processes: int = None) -> None:
+    """
+    Creates datasets for given years from datasets with various dates. The directory is scanned once and
+    every dataset is read once, datasets are split into yearly parts in parallel and the parts are joined
+    in the order of dataset start dates. A dataset is used for the years of its start and end dates.
+    If directory_path is an article store, each year is read from its partition instead.
+    """
+    if is_article_store(directory_path):
+        for year in sorted(set(years)):
+            export_store_to_csv(directory_path, Path(output_directory_path) / f"ria_dataset_{year}.csv", fieldnames,
+                                f"{year}-01-01", f"{year}-12-31")
+        return
+
+    years = set(years)
+    datasets = [(dataset_name, {start_year, end_year} & years)
+                for dataset_name, start_year, end_year in get_datasets_years(directory_path)
+                if {start_year, end_year} & years]
+    Path(output_directory_path).mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=output_directory_path) as parts_directory_path:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(partition_dataset, Path(directory_path) / dataset_name, dataset_years,
+                                       fieldnames, parts_directory_path, str(index))
+                       for index, (dataset_name, dataset_years) in enumerate(datasets)]
+            parts = [future.result() for future in futures]
+
+        for year in sorted(years):
+            output_filename = Path(output_directory_path) / f"ria_dataset_{year}.csv"
+            prepare_csv(output_filename, fieldnames)
+
+            with open(output_filename, "ab") as output_file:
+                for part_filenames in parts:
+                    if year not in part_filenames:
+                        continue
+                    with open(part_filenames[year], "rb") as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+
+
 def create_yearly_dataset(directory_path: str | Path, year: int, fieldnames: List[str],
                           output_directory_path: str | Path) -> None:
     """Creates dataset for given year from datasets with various dates"""
-    dataset_names = get_dataset_names_for_year(directory_path, year)
-    output_filename = Path(output_directory_path) / f"ria_dataset_{year}.csv"
-    prepare_csv(output_filename, fieldnames)
-
-    for dataset_name in dataset_names:
-        with open(Path(directory_path) / dataset_name, "r", encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            articles = [article for article in reader if article['date'] and
-                        datetime.strptime(article['date'], "%Y-%m-%d").year == year]
-            save_to_csv(articles, output_filename, fieldnames, create_new_file=False)
+    create_yearly_datasets(directory_path, [year], fieldnames, output_directory_path, processes=1)
 
 
 if __name__ == "__main__":
-    for year in range(2004, 2023):
-        create_yearly_dataset(ROOT_PATH / "parsers" / "ria_dataset", year, ["date", "title", "text", "source", "topics"],
-                              ROOT_PATH / "parsers" / "ria_yearly_dataset")
+    create_yearly_datasets(ROOT_PATH / "parsers" / "ria_dataset", list(range(2004, 2023)),
+                           ["date", "title", "text", "source", "topics"], ROOT_PATH / "parsers" / "ria_yearly_dataset")
@@ -1,44 +1,76 @@
 """Script to divide dataset into chunks by year"""
 import csv
-from datetime import datetime
 from pathlib import Path
 import sys
-from typing import List
+from typing import Dict, List, Optional
 
-from parsers.saving_to_csv import save_to_csv, prepare_csv
+from dataset_utils.article_store import export_store_to_csv, get_store_years, is_article_store
+from dataset_utils.parse_date import parse_date_key
+from dataset_utils.sorting import sort_csv_file
+from parsers.saving_to_csv import prepare_csv
 
 from constants import ROOT_PATH
 
 csv.field_size_limit(sys.maxsize)
 
 
-def divide_dataset_by_year(filename: str | Path, fieldnames: List[str], dataset_name: str, output_directory_path: str | Path) -> None:
-    """Divides dataset into chunks by year"""
-    with open(filename, "r", encoding='utf-8') as file:
-        reader = csv.DictReader(file, delimiter=',', quotechar='"')
-        articles_info = []
-        for row in reader:
-            if not row["date"]:
-                continue
-            try:
-                datetime.strptime(row["date"], "%Y-%m-%d")
-            except ValueError:
-                continue
-            articles_info.append(row)
+def get_date_key(date_string: str) -> Optional[str]:
+    """Returns the '%Y-%m-%d' key of a date written as '%Y-%m-%d' or None if it is not such a date"""
+    if not date_string or '/' in date_string:
+        return None
+    try:
+        return parse_date_key(date_string)
+    except ValueError:
+        return None
 
-    articles_info.sort(key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d"))
 
-    years = set([article_info["date"].split("-")[0] for article_info in articles_info])
+def get_article_date_key(article: Dict[str, str]) -> str:
+    return get_date_key(article["date"])
 
-    for year in years:
-        output_filename = Path(output_directory_path) / f"{dataset_name}_{year}.csv"
-        prepare_csv(output_filename, fieldnames)
-        for article in articles_info:
-            if year == article["date"].split("-")[0]:
-                save_to_csv([article], output_filename)
+
+def divide_dataset_by_year(filename: str | Path, fieldnames: List[str], dataset_name: str,
+                           output_directory_path: str | Path, sort: bool = True) -> None:
+    """
+    Divides dataset into chunks by year in one pass: every row is appended to the file of its year,
+    rows without a valid date are skipped. If sort is set, each yearly file is then sorted by date.
+    An article store is already partitioned by year, so each year is read from its partition.
+    """
+    if is_article_store(filename):
+        for year in get_store_years(filename):
+            output_filename = Path(output_directory_path) / f"{dataset_name}_{year}.csv"
+            export_store_to_csv(filename, output_filename, fieldnames, f"{year}-01-01", f"{year}-12-31")
+            if sort:
+                sort_csv_file(output_filename, get_article_date_key)
+        return
+
+    writers = {}
+
+    try:
+        with open(filename, "r", encoding='utf-8') as file:
+            for row in csv.DictReader(file, delimiter=',', quotechar='"'):
+                date_key = get_date_key(row["date"])
+                if date_key is None:
+                    continue
+
+                year = row["date"].split("-")[0]
+                if year not in writers:
+                    output_filename = Path(output_directory_path) / f"{dataset_name}_{year}.csv"
+                    prepare_csv(output_filename, fieldnames)
+                    output_file = open(output_filename, "a", encoding='utf-8')
+                    writer = csv.DictWriter(output_file, fieldnames=fieldnames)
+                    writers[year] = (output_filename, output_file, writer)
+
+                writers[year][2].writerow(row)
+    finally:
+        for _, output_file, _ in writers.values():
+            output_file.close()
+
+    if sort:
+        for output_filename, _, _ in writers.values():
+            sort_csv_file(output_filename, get_article_date_key)
 
 
 if __name__ == "__main__":
     divide_dataset_by_year(ROOT_PATH / "parsers" / "kommersant_dataset" / "kommersant-news.csv",
-                           ["date", "title", "text", "topic"],
+                           ["date", "title", "text", "topic"], "kommersant",
                            ROOT_PATH / "parsers" / "kommersant_dataset")
@@ -1,23 +1,58 @@
 """Script that merges datasets from different sources into one dataset"""
 import csv
 from datetime import datetime
+from functools import partial
+import os
 import sys
+from pathlib import Path
+from typing import Dict, Iterator, List
 
-from dataset_utils.parse_date import parse_date, convert_date
-from parsers.saving_to_csv import save_to_csv, prepare_csv
+from dataset_utils.article_store import ArticleStoreWriter, is_article_store, read_articles
+from dataset_utils.parse_date import parse_date_key
+from dataset_utils.sorting import merge_sorted, sorted_rows
+from parsers.saving_to_csv import prepare_csv
 from constants import ROOT_PATH
 
 
 csv.field_size_limit(sys.maxsize)
 
 
+def get_date(article: Dict[str, str]) -> str:
+    return article['date']
+
+
+def read_dataset(dataset_filename: str | Path, fieldnames: List[str], start_date: str,
+                 end_date: str) -> Iterator[Dict[str, str]]:
+    """
+    Yields rows of the dataset between start_date and end_date with dates converted to '%Y-%m-%d'.
+    The dataset is a csv file or an article store, from a store only the needed dates and columns are read.
+    """
+    if is_article_store(dataset_filename):
+        yield from read_articles(dataset_filename, fieldnames, start_date, end_date)
+        return
+
+    with open(dataset_filename, "r", encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            row_dict = {fieldname: row[fieldname] for fieldname in fieldnames}
+            row_dict['date'] = parse_date_key(row_dict['date'])
+
+            if start_date <= row_dict['date'] <= end_date:
+                yield row_dict
+
+
 def merge_datasets(dataset_filenames: list, start_date: str, end_date: str, fieldnames: list,
-                   output_filename: str = "", skip_not_existing_datasets: bool = False) -> None:
-    """Merges datasets from different sources into one dataset"""
-    if output_filename:
-        prepare_csv(output_filename, fieldnames)
-    else:
+                   output_filename: str = "", skip_not_existing_datasets: bool = False,
+                   chunk_size: int = 100_000, store_output: bool = False) -> None:
+    """
+    Merges datasets from different sources into one dataset sorted by date.
+    Datasets are streamed: sorted ones are merged as they are, the others are sorted on disk in chunks
+    of chunk_size rows first, so memory use does not depend on the size of the datasets.
+    Datasets may be csv files or article stores. If store_output is set, output_filename is an article store.
+    The output is replaced if it exists.
+    """
+    if not output_filename:
         output_filename = "merged_dataset.csv"
+    if not store_output:
         prepare_csv(output_filename, fieldnames)
 
     start_date = datetime.strptime(start_date, "%Y-%m-%d")
@@ -29,38 +64,31 @@ def merge_datasets(dataset_filenames: list, start_date: str, end_date: str, fiel
     if end_date < start_date:
         print("End date is earlier than start date.")
 
-    articles_info = []
-
-    for dataset_filename in dataset_filenames:
-        try:
-            with open(dataset_filename, "r", encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-
-                for row in reader:
-                    row_dict = {fieldname: row[fieldname] for fieldname in fieldnames}
-                    parsed_date = parse_date(row_dict['date'])
-
-                    if '/' in row_dict['date']:
-                        row_dict['date'] = convert_date(row_dict['date'], "%Y-%m-%d")
-
-                    if parsed_date < start_date:
-                        continue
+    start_date = start_date.strftime("%Y-%m-%d")
+    end_date = end_date.strftime("%Y-%m-%d")
 
-                    if parsed_date > end_date:
-                        continue
+    sources = []
 
-                    articles_info.append(row_dict)
-
-        except (FileNotFoundError, FileExistsError):
+    for dataset_filename in dataset_filenames:
+        if not os.path.exists(dataset_filename):
             if skip_not_existing_datasets:
                 print(f"Skipping {dataset_filename} because could not find it.")
-                pass
+                continue
             else:
                 raise FileNotFoundError(f"File with path {dataset_filename} does not exist. "
                                         f" skip_not_existing_datasets if you want to skip it.")
 
-    articles_info.sort(key=lambda x: parse_date(x['date']))
-    save_to_csv(articles_info, output_filename)
+        read_rows = partial(read_dataset, dataset_filename, fieldnames, start_date, end_date)
+        sources.append(sorted_rows(read_rows, get_date, fieldnames, chunk_size))
+
+    if store_output:
+        with ArticleStoreWriter(output_filename, fieldnames, overwrite=True) as writer:
+            writer.writerows(merge_sorted(sources, get_date))
+        return
+
+    with open(output_filename, "a", encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writerows(merge_sorted(sources, get_date))
 
 
 if __name__ == "__main__":
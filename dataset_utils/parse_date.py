@@ -17,6 +17,19 @@ def parse_date(date_string: str) -> Optional[datetime]:
     return date
 
 
+def parse_date_key(date_string: str) -> str:
+    """
+    Returns the date as a '%Y-%m-%d' string, which sorts in date order. Dates in '%Y/%m/%d' and '%Y-%m-%d'
+    are converted by slicing, other strings and days after the 28th are checked by parse_date.
+    """
+    if len(date_string) == 10 and date_string[4] == date_string[7] and date_string[4] in '/-':
+        year, month, day = date_string[:4], date_string[5:7], date_string[8:]
+        if year.isdigit() and month.isdigit() and day.isdigit() and '01' <= month <= '12' and '01' <= day <= '28':
+            return f"{year}-{month}-{day}"
+
+    return parse_date(date_string).strftime("%Y-%m-%d")
+
+
 def convert_date(date_string: str, new_pattern: str) -> str:
     date = parse_date(date_string)
     return datetime.strftime(date, new_pattern)
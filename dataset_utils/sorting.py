@@ -0,0 +1,92 @@
+"""Helpers to sort and merge csv rows by a key without loading whole datasets into memory"""
+import csv
+import heapq
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List
+
+csv.field_size_limit(sys.maxsize)
+
+
+def is_sorted(rows: Iterable[Dict[str, str]], key: Callable) -> bool:
+    """Checks in one pass if rows are sorted by key"""
+    previous_key = None
+    for row in rows:
+        row_key = key(row)
+        if previous_key is not None and row_key < previous_key:
+            return False
+        previous_key = row_key
+    return True
+
+
+def read_spill_file(filename: str | os.PathLike, fieldnames: List[str]) -> Iterator[Dict[str, str]]:
+    with open(filename, "r", encoding='utf-8', newline='') as file:
+        yield from csv.DictReader(file, fieldnames=fieldnames)
+
+
+def external_sort(rows: Iterable[Dict[str, str]], key: Callable, fieldnames: List[str], chunk_size: int = 100_000,
+                  tmp_directory_path: str | os.PathLike = None) -> Iterator[Dict[str, str]]:
+    """
+    Yields rows sorted by key. Rows are sorted in chunks of chunk_size rows that are spilled to temporary
+    csv files and then merged, so at most chunk_size rows are held in memory. Equal keys keep their order.
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_directory_path) as spill_directory_path:
+        spill_filenames = []
+        chunk = []
+
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) < chunk_size:
+                continue
+
+            chunk.sort(key=key)
+            spill_filename = os.path.join(spill_directory_path, f"{len(spill_filenames)}.csv")
+            with open(spill_filename, "w", encoding='utf-8', newline='') as file:
+                csv.DictWriter(file, fieldnames=fieldnames).writerows(chunk)
+            spill_filenames.append(spill_filename)
+            chunk = []
+
+        chunk.sort(key=key)
+        if not spill_filenames:
+            yield from chunk
+            return
+
+        yield from heapq.merge(*[read_spill_file(spill_filename, fieldnames) for spill_filename in spill_filenames],
+                               chunk, key=key)
+
+
+def sorted_rows(read_rows: Callable[[], Iterable[Dict[str, str]]], key: Callable, fieldnames: List[str],
+                chunk_size: int = 100_000) -> Iterator[Dict[str, str]]:
+    """
+    Yields rows of read_rows() sorted by key. read_rows is called once to check if the rows are already
+    sorted, then they are streamed as they are, otherwise they are sorted with external_sort.
+    """
+    if is_sorted(read_rows(), key):
+        return iter(read_rows())
+    return external_sort(read_rows(), key, fieldnames, chunk_size)
+
+
+def merge_sorted(sources: List[Iterable[Dict[str, str]]], key: Callable) -> Iterator[Dict[str, str]]:
+    """Merges sources sorted by key into one sorted stream, equal keys keep the order of sources"""
+    return heapq.merge(*sources, key=key)
+
+
+def sort_csv_file(filename: str | os.PathLike, key: Callable, chunk_size: int = 100_000) -> None:
+    """Sorts rows of the csv file by key in place, the file is not rewritten if it is already sorted"""
+    with open(filename, "r", encoding='utf-8') as file:
+        fieldnames = csv.DictReader(file).fieldnames
+
+    def read_rows():
+        with open(filename, "r", encoding='utf-8') as file:
+            yield from csv.DictReader(file)
+
+    if is_sorted(read_rows(), key):
+        return
+
+    with open(f"{filename}.tmp", "w", encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(external_sort(read_rows(), key, fieldnames, chunk_size,
+                                       tmp_directory_path=os.path.dirname(os.path.abspath(filename))))
+    os.replace(f"{filename}.tmp", filename)
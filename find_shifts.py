@@ -2,6 +2,8 @@ import numpy as np
 import csv
 
 from constants import ROOT_PATH
+from models.registry import ModelRegistry
+from models.shared_vocab import SharedVocabIndex
 from models.utils.utils import load_model
 
 
@@ -15,15 +17,38 @@ with open(ROOT_PATH / 'config.tsv', 'r') as csvfile:
         our_models[row['identifier']]['tags'] = row['tags']
         our_models[row['identifier']]['corpus_size'] = int(row['size'])
 
-models_dict = {}
+MODELS_MEMORY_BUDGET = 8 * 1024 ** 3
 
-def frequency(word, model):
+
+def load_our_model(model):
+    keyed_vectors = load_model(str(ROOT_PATH) + our_models[model]['path'], prefer_mmap=True)
+    our_models[model]['vocabulary'] = set(keyed_vectors.index2word)
+    return keyed_vectors
+
+
+def forget_model(model):
+    our_models[model].pop('vocabulary', None)
+    model_arrays.pop(model, None)
+    checked_models.discard(model)
+
+
+models_dict = ModelRegistry(load_our_model, MODELS_MEMORY_BUDGET, keys=our_models.keys(), on_evict=forget_model)
+model_arrays = {}
+shared_index = None
+checked_models = set()
+
+FREQUENCY_TIERS = ('low', 'mid', 'high')
+
+
+def frequency(word, model, keyed_vectors=None):
+    if keyed_vectors is None:
+        keyed_vectors = models_dict[model]
     corpus_size = our_models[model]['corpus_size']
-    if word not in models_dict[model].vocab:
+    if word not in keyed_vectors.vocab:
         return 0, 'low'
     if not our_models[model]['vocabulary']:
         return 0, 'mid'
-    wordfreq = models_dict[model].vocab[word].count
+    wordfreq = keyed_vectors.vocab[word].count
     relative = wordfreq / corpus_size
     tier = 'mid'
     if relative > 0.0001:
@@ -33,8 +58,100 @@ def frequency(word, model):
     return wordfreq, tier
 
 
+def get_model_arrays(model: str, keyed_vectors=None) -> dict:
+    """Returns words, counts and frequency tiers of the model as arrays aligned with its rows"""
+    if model in model_arrays:
+        return model_arrays[model]
+
+    if keyed_vectors is None:
+        keyed_vectors = models_dict[model]
+    words = np.array(keyed_vectors.index2word)
+    counts = np.array([keyed_vectors.vocab[word].count for word in keyed_vectors.index2word], dtype=np.int64)
+
+    if our_models[model]['vocabulary']:
+        relative = counts / our_models[model]['corpus_size']
+        tiers = np.ones(len(words), dtype=np.int8)
+        tiers[relative > 0.0001] = 2
+        tiers[relative < 0.00005] = 0
+    else:
+        counts = np.zeros(len(words), dtype=np.int64)
+        tiers = np.ones(len(words), dtype=np.int8)
+
+    model_arrays[model] = {'words': words, 'counts': counts, 'tiers': tiers}
+    return model_arrays[model]
+
+
+def get_shared_rows(model1: str, model2: str) -> tuple:
+    """Returns shared rows of the models from the shared index, rebuilding the index if the models changed"""
+    global shared_index
+    for model in (model1, model2):
+        if model in checked_models:
+            continue
+        if not shared_index.matches(model, models_dict[model].index2word):
+            shared_index = shared_index.refreshed({model: models_dict[model].index2word})
+        checked_models.add(model)
+    return shared_index.shared_rows(model1, model2)
+
+
+def find_shifts_vectorized(query):
+    """Same as find_shifts, but works on whole arrays instead of looping over the shared vocabulary"""
+    with models_dict.pinned(query['model1'], query['model2']):
+        return _find_shifts_vectorized(query)
+
+
+def _find_shifts_vectorized(query):
+    model1 = models_dict[query['model1']]
+    model2 = models_dict[query['model2']]
+    pos = query.get("pos")
+    n = query['n']
+    arrays = get_model_arrays(query['model1'], model1)
+
+    if shared_index is not None:
+        _, rows1, rows2 = get_shared_rows(query['model1'], query['model2'])
+    else:
+        words2 = get_model_arrays(query['model2'], model2)['words']
+        _, rows1, rows2 = np.intersect1d(arrays['words'], words2, assume_unique=True, return_indices=True)
+        order = np.argsort(rows1)
+        rows1, rows2 = rows1[order], rows2[order]
+
+    sims = np.einsum('ij,ij->i', model1.vectors[rows1], model2.vectors[rows2], dtype=np.float64)
+
+    if pos == "ALL":
+        candidates = np.arange(len(rows1))
+    else:
+        candidates = np.flatnonzero(np.char.endswith(arrays['words'][rows1], pos))
+
+    selected = []
+    tiers = arrays['tiers'][rows1[candidates]]
+    for tier in range(len(FREQUENCY_TIERS)):
+        tier_candidates = candidates[tiers == tier]
+        if len(tier_candidates) > n:
+            tier_candidates = tier_candidates[np.argpartition(sims[tier_candidates], n - 1)[:n]]
+        selected.append(tier_candidates)
+
+    selected = np.concatenate(selected)
+    selected = selected[np.argsort(sims[selected], kind='stable')]
+
+    results = {'neighbors': [], 'frequencies': {}}
+    for nr in selected:
+        row = rows1[nr]
+        word = arrays['words'][row].item()
+        results['neighbors'].append((word, sims[nr]))
+        results['frequencies'][word] = (arrays['counts'][row].item(), FREQUENCY_TIERS[arrays['tiers'][row]])
+
+    return results
+
+
 def find_shifts(query):
     print(query['model1'])
+    if query.get("engine") == "vectorized":
+        return find_shifts_vectorized(query)
+    # both models stay loaded for the whole query
+    with models_dict.pinned(query['model1'], query['model2']):
+        return _find_shifts(query)
+
+
+def _find_shifts(query):
     model1 = models_dict[query['model1']]
     model2 = models_dict[query['model2']]
     pos = query.get("pos")
@@ -58,7 +175,7 @@ def find_shifts(query):
         word = shared_voc[nr]
         sim = sims[nr]
 
-        freq = frequency(word, query['model1'])
+        freq = frequency(word, query['model1'], model1)
         if word.endswith(pos) or pos == "ALL":
             if freq_type_num[freq[1]] < n:
                 results['neighbors'].append((word, sim))
@@ -74,12 +191,12 @@ if __name__ == "__main__":
         "model1": "2013",
         "model2": "2014",
         "pos": "ALL",
-        "n": 30
+        "n": 30,
+        "engine": "vectorized"
     }
 
-    for model in ["2013", "2014"]:
-        print(model)
-        models_dict[model] = load_model(str(ROOT_PATH) + our_models[model]['path'])
-        our_models[model]['vocabulary'] = set(models_dict[model].index2word)
+    if (ROOT_PATH / 'models' / 'shared_vocab_index').exists():
+        shared_index = SharedVocabIndex(ROOT_PATH / 'models' / 'shared_vocab_index')
 
     print(find_shifts(request))
+    print(models_dict)
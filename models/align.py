@@ -1,38 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import gensim
+import numpy as np
+
 from procrustes import smart_procrustes_align_gensim
-from utils.utils import load_model
+from utils.utils import get_mmap_filepath, load_model, save_model_mmap
 
 from constants import ROOT_PATH
 
 
+def get_aligned_filepath(model_filepath: str | Path, extension: str = ".bin.gz") -> Path:
+    """
+    Returns the path of the aligned model next to the original
+    (merged_cbow_2013.txt.gz -> merged_cbow_2013_aligned.bin.gz)
+    """
+    mmap_filepath = Path(get_mmap_filepath(str(model_filepath)))
+    return mmap_filepath.with_name(mmap_filepath.stem + "_aligned" + extension)
+
+
 def align_and_save_model(base_model_filepath: str | Path, model_to_align_filepath: str | Path,
                          save_as_binary: bool = True) -> None:
     models = []
 
     for model_filepath in [base_model_filepath, model_to_align_filepath]:
-        model = load_model(str(model_filepath))
-        model.init_sims(replace=True)
-        models.append(model)
+        # load_model returns normalized vectors, memory-mapped ones are read-only
+        models.append(load_model(str(model_filepath)))
 
     print("Aligning models...")
     models[1] = smart_procrustes_align_gensim(models[0], models[1])
     print("Alignment complete")
 
-    name = str(model_to_align_filepath).split(".")[0]
-    new_name = name + "_aligned"
-    if save_as_binary:
-        models[1].save_word2vec_format(new_name + ".bin.gz", binary=True)
-    else:
-        models[1].save_word2vec_format(new_name + ".txt.gz", binary=False)
+    output_filepath = get_aligned_filepath(model_to_align_filepath, ".bin.gz" if save_as_binary else ".txt.gz")
+    models[1].save_word2vec_format(str(output_filepath), binary=save_as_binary)
+
+
+_base = {}
+
+
+def _set_base_model(base_model: gensim.models.KeyedVectors, base_words: np.ndarray) -> None:
+    """Keeps the base model and the array of its words in the worker process"""
+    _base['model'] = base_model
+    _base['words'] = base_words
+
+
+def _align_and_save_to_base(model_to_align_filepath: str | Path, output_filepath: str | Path) -> str:
+    model = load_model(str(model_to_align_filepath))
+    # (shared words, rows in the base model, rows in the model)
+    shared_rows = np.intersect1d(_base['words'], np.array(model.index2word), assume_unique=True,
+                                 return_indices=True)
+
+    model = smart_procrustes_align_gensim(_base['model'], model, shared_rows=shared_rows)
+    model.save_word2vec_format(str(output_filepath), binary=".bin" in Path(output_filepath).name)
+    save_model_mmap(model, get_mmap_filepath(str(output_filepath)))
+    return str(output_filepath)
+
+
+def align_and_save_models(base_model_filepath: str | Path, models_to_align_filepaths: list,
+                          output_filepaths: list = None, processes: int = None) -> None:
+    """
+    Aligns all models to the base model, which is loaded only once, in a pool of processes.
+    Each model is saved in word2vec format to its output file, by default next to the original
+    with the "_aligned" suffix, and as a memory-mapped .npy copy next to it (see utils.save_model_mmap)
+    """
+    base_model = load_model(str(base_model_filepath))
+    base_words = np.array(base_model.index2word)
+
+    if output_filepaths is None:
+        output_filepaths = [get_aligned_filepath(model_filepath) for model_filepath in models_to_align_filepaths]
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_set_base_model,
+                             initargs=(base_model, base_words)) as executor:
+        for output_filepath in executor.map(_align_and_save_to_base, models_to_align_filepaths,
+                                            output_filepaths):
+            print(f"Model {output_filepath} aligned and saved")
 
 
 if __name__ == "__main__":
-    for year in range(2000, 2023):
-        print(f"Aligning model for {year} year...")
-        align_and_save_model(
-            str(ROOT_PATH / "models" / "merged_cbow_2017.txt.gz"),
-            str(ROOT_PATH / "models" / f"merged_cbow_{year}.txt.gz"),
-            save_as_binary=False
-        )
-        print(f"Model for {year} year aligned and saved")
+    # Output names are the paths of config.tsv
+    align_and_save_models(
+        str(ROOT_PATH / "models" / "merged_cbow_2017.txt.gz"),
+        [str(ROOT_PATH / "models" / f"merged_cbow_{year}.txt.gz") for year in range(2000, 2023)],
+        [str(ROOT_PATH / "models" / f"merged_{year}_aligned.bin.gz") for year in range(2000, 2023)]
+    )
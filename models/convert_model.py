@@ -2,7 +2,7 @@
 from pathlib import Path
 
 from constants import ROOT_PATH
-from utils.utils import load_model
+from utils.utils import load_model, get_mmap_filepath, save_model_mmap
 
 
 def convert_model_to_text(model_filepath: str | Path, output_filepath: str | Path) -> None:
@@ -17,11 +17,24 @@ def convert_model_to_binary(model_filepath: str | Path, output_filepath: str | P
     model.save_word2vec_format(output_filepath, binary=True)
 
 
+def convert_model_to_mmap(model_filepath: str | Path, output_filepath: str | Path = None) -> None:
+    """Convert Word2Vec model to .npy vectors with .vocab.tsv sidecar that are loaded with mmap"""
+    model = load_model(str(model_filepath))
+    save_model_mmap(model, str(output_filepath or get_mmap_filepath(str(model_filepath))))
+
+
 if __name__ == "__main__":
+    # align.py writes the binary and memory-mapped models itself, older text models are converted here
+    for year in range(2000, 2023):
+        binary_filepath = ROOT_PATH / "models" / f"merged_{year}_aligned.bin.gz"
+        if not binary_filepath.exists():
+            print(f"Converting model for {year} year...")
+            convert_model_to_binary(str(ROOT_PATH / "models" / f"merged_{year}_aligned.txt"), str(binary_filepath))
+            print(f"Model for {year} year converted and saved")
+
     for year in range(2000, 2023):
-        print(f"Converting model for {year} year...")
-        convert_model_to_binary(
-            str(ROOT_PATH / "models" / f"merged_{year}_aligned.txt"),
-            str(ROOT_PATH / "models" / f"merged_{year}_aligned.bin.gz"),
-        )
-        print(f"Model for {year} year converted and saved")
+        binary_filepath = str(ROOT_PATH / "models" / f"merged_{year}_aligned.bin.gz")
+        if not Path(get_mmap_filepath(binary_filepath)).exists():
+            print(f"Converting model for {year} year to memory-mapped format...")
+            convert_model_to_mmap(binary_filepath)
+            print(f"Model for {year} year converted and saved")
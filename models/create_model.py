@@ -1,30 +1,183 @@
 """Script to create Word2Vec model using gensim"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import os
 from pathlib import Path
+import time
 
-from gensim.models import Word2Vec
+from gensim.models import KeyedVectors, Word2Vec
+from gensim.models.word2vec import LineSentence
 
 from constants import ROOT_PATH
+from preprocessing.token_corpus import TokenCorpus
 
 
-def create_model(text_filepath: str | Path, config: dict = None) -> Word2Vec:
-    """Create Word2Vec model using gensim"""
-    with open(text_filepath, "r", encoding="utf-8") as file:
-        text = file.read()
+# Training parameters, a config passed to the functions below overrides some of them
+DEFAULT_CONFIG = {
+    "min_count": 10,
+    "window": 5,
+    "sg": 0,
+    "iter": 10
+}
 
-    if not config:
-        config = {
-            "min_count": 10,
-            "window": 5,
-            "sg": 0,
-            "iter": 10
-        }
 
-    sentences = [sentence.split() for sentence in text.splitlines()]
+def create_model(text_filepath: str | Path, config: dict = None, workers: int = 12) -> Word2Vec:
+    """Create Word2Vec model using gensim.
+    Sentences are streamed from the file line by line on every pass, so the corpus is never held in memory"""
+    config = {**DEFAULT_CONFIG, **(config or {})}
 
-    return Word2Vec(sentences, min_count=config["min_count"], size=300, workers=12, window=config["window"],
+    sentences = LineSentence(str(text_filepath))
+
+    return Word2Vec(sentences, min_count=config["min_count"], size=300, workers=workers, window=config["window"],
                     sg=config["sg"], iter=config["iter"])
 
 
+def create_model_from_token_corpus(corpus: TokenCorpus, year: int, config: dict = None,
+                                   workers: int = 12) -> Word2Vec:
+    """Create Word2Vec model from a year of the token corpus (see preprocessing/token_corpus.py).
+    The vocabulary is built from precomputed counts, so the text is not scanned before training"""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+
+    model = Word2Vec(min_count=config["min_count"], size=300, workers=workers, window=config["window"],
+                     sg=config["sg"], iter=config["iter"])
+    model.build_vocab_from_freq(corpus.word_counts(year), corpus_count=corpus.sentence_count(year))
+    model.train(corpus.sentences(year), total_examples=corpus.sentence_count(year), epochs=model.epochs)
+    return model
+
+
+def update_model(model: Word2Vec, text_filepath: str | Path, config: dict = None) -> tuple[Word2Vec, dict]:
+    """Continue training of a model on a new corpus (e.g. the previous year's model on the next year).
+    The vocabulary is extended with the new words and only the new corpus is used for training,
+    for config["update_iter"] epochs if given, otherwise for config["iter"] epochs.
+    Returns the model and the word counts of the new corpus"""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+
+    sentences = LineSentence(str(text_filepath))
+    model.build_vocab(sentences, update=True, keep_raw_vocab=True)
+    counts = dict(model.vocabulary.raw_vocab)
+    model.train(sentences, total_examples=model.corpus_count, epochs=config.get("update_iter", config["iter"]))
+    return model, counts
+
+
+def get_corpus_vectors(model: Word2Vec, counts: dict, min_count: int) -> KeyedVectors:
+    """Returns vectors of the words that occur in the corpus at least min_count times, with their counts in it.
+    A continued model keeps the words of all previous corpora and sums their counts,
+    so this gives vectors comparable to a model trained on the last corpus only"""
+    words = sorted((word for word in model.wv.index2word if counts.get(word, 0) >= min_count),
+                   key=lambda word: counts[word], reverse=True)
+    corpus_vectors = KeyedVectors(model.wv.vector_size)
+    corpus_vectors.add(words, model.wv[words])
+    for word in words:
+        corpus_vectors.vocab[word].count = counts[word]
+    return corpus_vectors
+
+
+def create_models_incrementally(text_filepaths: dict, output_filepaths: dict, full_model_filepaths: dict,
+                                config: dict = None) -> None:
+    """Create models year by year, initializing each year's model from the previous one.
+    Full models are saved to continue from them later, so years that already have a full model are not retrained
+    and adding a new year costs one year's training"""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+
+    model = None
+    for year in sorted(text_filepaths):
+        if Path(full_model_filepaths[year]).exists():
+            model = None
+            continue
+
+        if model is None:
+            previous_years = [previous_year for previous_year in full_model_filepaths
+                              if previous_year < year and Path(full_model_filepaths[previous_year]).exists()]
+            if previous_years:
+                model = Word2Vec.load(str(full_model_filepaths[max(previous_years)]))
+
+        print(f"Creating model for {year} year...")
+        if model is None:
+            model = create_model(text_filepaths[year], config=config)
+            corpus_vectors = model.wv
+        else:
+            model, counts = update_model(model, text_filepaths[year], config=config)
+            corpus_vectors = get_corpus_vectors(model, counts, config["min_count"])
+
+        corpus_vectors.save_word2vec_format(str(output_filepaths[year]),
+                                            binary=".bin" in Path(output_filepaths[year]).name)
+        model.save(str(full_model_filepaths[year]))
+
+
+def allocate_workers(corpus_sizes: dict, total_workers: int, jobs: int) -> dict:
+    """Divides cores between trainings in proportion to corpus sizes,
+    so that jobs trainings of average size running at once use all cores.
+    Bigger trainings get more than their share, create_models_in_parallel then runs fewer of them at once"""
+    average_size = sum(corpus_sizes.values()) / len(corpus_sizes)
+    return {key: max(1, min(total_workers, round(total_workers / jobs * size / average_size)))
+            for key, size in corpus_sizes.items()}
+
+
+def create_and_save_model(text_filepath: str | Path, output_filepath: str | Path, config: dict = None,
+                          workers: int = 12) -> dict:
+    """Create Word2Vec model, save its vectors and return training statistics.
+    The model is written under a temporary name first, so an interrupted training never leaves a complete-looking file.
+    The temporary file is removed if training or saving fails, a file left by a killed run is removed on start"""
+    output_filepath = Path(output_filepath)
+    temporary_filepath = output_filepath.with_name("tmp_" + output_filepath.name)
+    temporary_filepath.unlink(missing_ok=True)
+
+    try:
+        start_time = time.time()
+        model = create_model(text_filepath, config=config, workers=workers)
+        elapsed = time.time() - start_time
+
+        model.wv.save_word2vec_format(str(temporary_filepath), binary=".bin" in output_filepath.name)
+        os.replace(temporary_filepath, output_filepath)
+    except BaseException:
+        temporary_filepath.unlink(missing_ok=True)
+        raise
+
+    return {"workers": workers, "seconds": elapsed,
+            "words_per_second": model.corpus_total_words * model.epochs / elapsed}
+
+
+def create_models_in_parallel(text_filepaths: dict, output_filepaths: dict, config: dict = None,
+                              jobs: int = 3, total_workers: int = None) -> dict:
+    """Create models for several years at once in separate processes.
+    Years whose output file already exists are skipped, so the run can be restarted after a crash.
+    Bigger corpora are started first and get more worker threads. At most jobs trainings run at once
+    and a training is started only when its workers fit into total_workers together with the running ones"""
+    total_workers = total_workers or os.cpu_count()
+    years = [year for year in text_filepaths if not Path(output_filepaths[year]).exists()]
+    if not years:
+        return {}
+
+    corpus_sizes = {year: os.path.getsize(text_filepaths[year]) for year in years}
+    workers = allocate_workers(corpus_sizes, total_workers, jobs)
+
+    statistics = {}
+    pending = sorted(years, key=lambda x: corpus_sizes[x], reverse=True)
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            while pending and len(running) < jobs:
+                free_workers = total_workers - sum(workers[year] for year in running.values())
+                year = next((year for year in pending if workers[year] <= free_workers), None)
+                if year is None:
+                    if running:
+                        break
+                    year = pending[0]
+                pending.remove(year)
+
+                print(f"Creating model for {year} year with {workers[year]} workers...")
+                running[executor.submit(create_and_save_model, text_filepaths[year], output_filepaths[year],
+                                        config, workers[year])] = year
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                year = running.pop(future)
+                statistics[year] = future.result()
+                print(f"Model for {year} year created in {statistics[year]['seconds']:.1f}s, "
+                      f"{statistics[year]['words_per_second']:.0f} words/sec")
+
+    return statistics
+
+
 if __name__ == "__main__":
     #model = create_model(str(ROOT_PATH / "datasets" / "test_2013_preprocessed.txt"))
     #model.wv.save_word2vec_format(str(ROOT_PATH / "models" / "test_2013.txt.gz"), binary=False)
@@ -34,21 +187,14 @@ if __name__ == "__main__":
 
     #raise Exception
 
-    configs = [
-        {
-            "min_count": 10,
-            "window": 5,
-            "sg": 0,
-            "iter": 10
-        }
-    ]
+    configs = [DEFAULT_CONFIG]
 
     for config in configs:
         print(f"Using config: min_count: {config['min_count']}, window: {config['window']},"
               f"sg: {config['sg']}, iter: {config['iter']}")
-        for year in range(2000, 2023):
-            print(f"Creating model for {year} year...")
-            model = create_model(str(ROOT_PATH / "datasets" / "merged_dataset" / f"merged_{year}_preprocessed.txt"),
-                                 config=config)
-            model.wv.save_word2vec_format(str(ROOT_PATH / "models" / f"merged_cbow_-_{year}.txt.gz"),
-                                          binary=False)
+        create_models_in_parallel(
+            {year: ROOT_PATH / "datasets" / "merged_dataset" / f"merged_{year}_preprocessed.txt"
+             for year in range(2000, 2023)},
+            {year: ROOT_PATH / "models" / f"merged_cbow_-_{year}.txt.gz" for year in range(2000, 2023)},
+            config=config
+        )
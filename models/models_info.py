@@ -1,6 +1,14 @@
+import csv
+import os
+
+from registry import ModelRegistry
+from shared_vocab import SharedVocabIndex
 from utils.utils import load_model
 from constants import ROOT_PATH
 
+MODELS_MEMORY_BUDGET = 4 * 1024 ** 3
+SHARED_VOCAB_INDEX_DIRPATH = ROOT_PATH / 'models' / 'shared_vocab_index'
+
 
 def get_models_paths() -> list[str]:
     """Returns a list of paths to all model files from models directory"""
@@ -8,54 +16,87 @@ def get_models_paths() -> list[str]:
     return sorted(paths)
 
 
-def load_models() -> dict:
-    """Loads all models into a dictionary"""
-    models_dict = {}
-    for model in get_models_paths():
-        models_dict[model] = load_model(model)
-    return models_dict
+def load_models(max_bytes: int = MODELS_MEMORY_BUDGET) -> ModelRegistry:
+    """Returns a dictionary-like registry of all models that loads them on first access
+    and keeps at most max_bytes of them in memory"""
+    return ModelRegistry(load_model, max_bytes, keys=get_models_paths())
+
+
+def load_shared_vocab_index() -> SharedVocabIndex | None:
+    """Returns the shared vocabulary index of the models (see shared_vocab.py) or None if it was not built"""
+    if not (SHARED_VOCAB_INDEX_DIRPATH / 'identifiers.json').exists():
+        return None
+    return SharedVocabIndex(SHARED_VOCAB_INDEX_DIRPATH)
+
+
+def get_models_identifiers() -> dict[str, str]:
+    """Returns a dictionary of paths to the models from config.tsv and their identifiers"""
+    with open(ROOT_PATH / 'config.tsv', 'r') as csvfile:
+        return {str(ROOT_PATH) + row['path']: row['identifier'] for row in csv.DictReader(csvfile, delimiter='\t')}
+
 
+def get_shared_words(model1_path: str, model2_path: str, models: ModelRegistry,
+                     index: SharedVocabIndex | None = None) -> list:
+    """Returns the intersection of the two models' vocabularies.
+    It is taken from the shared vocabulary index if the index has both models and was built after their files
+    were written, otherwise the models are loaded from the registry and their vocabularies are intersected"""
+    if index is not None:
+        identifiers = get_models_identifiers()
+        identifier1, identifier2 = identifiers.get(model1_path), identifiers.get(model2_path)
+        built_time = os.path.getmtime(index.dirpath / 'identifiers.json')
+        if identifier1 in index.identifiers and identifier2 in index.identifiers \
+                and max(os.path.getmtime(model1_path), os.path.getmtime(model2_path)) <= built_time:
+            return index.shared_words(identifier1, identifier2)
+    return list(set.intersection(set(models[model1_path].index2word), set(models[model2_path].index2word)))
 
-def get_vocab_pos_count(model1, model2) -> dict:
-    """Returns a dictionary of parts of speech and their counts in the intersection of the two models' vocabularies"""
+
+def get_pos_count(words) -> dict:
+    """Returns a dictionary of parts of speech and their counts in the words"""
     vocab_pos = {}
-    for word in set.intersection(set(model1.index2word), set(model2.index2word)):
+    for word in words:
         pos = word.split('_')[1] if '_' in word else 'NONE'
         vocab_pos[pos] = vocab_pos.get(pos, 0) + 1
     return vocab_pos
 
 
-def get_vocab_count(model1, model2) -> int:
-    """Returns the number of words in the intersection of the two models' vocabularies"""
-    return len(set.intersection(set(model1.index2word), set(model2.index2word)))
+def get_vocab_pos_count(model1, model2, shared_vocab: list = None) -> dict:
+    """Returns a dictionary of parts of speech and their counts in the intersection of the two models' vocabularies.
+    The intersection can be taken from the shared vocabulary index instead of being computed (see get_shared_words)."""
+    if shared_vocab is None:
+        shared_vocab = set.intersection(set(model1.index2word), set(model2.index2word))
+    return get_pos_count(shared_vocab)
+
+
+def get_vocab_count(model1, model2, shared_vocab: list = None) -> int:
+    """Returns the number of words in the intersection of the two models' vocabularies.
+    The intersection can be taken from the shared vocabulary index instead of being computed (see get_shared_words)."""
+    if shared_vocab is None:
+        shared_vocab = set.intersection(set(model1.index2word), set(model2.index2word))
+    return len(shared_vocab)
 
 
 def get_vocab_pos_count_for_all_models(ignore_duplicate_words: bool = False) -> dict:
-    """Returns a dictionary of parts of speech and their counts in the yearly intersection of all models' vocabularies"""
+    """Returns a dictionary of parts of speech and their counts in the yearly intersection of all models' vocabularies.
+    Intersections are read from the shared vocabulary index when it is up to date, so the models are not loaded"""
     all_words = []
     models = load_models()
-    for index in range(len(models) - 1):
-        model1 = models[get_models_paths()[index]]
-        model2 = models[get_models_paths()[index + 1]]
-        for word in set.intersection(set(model1.index2word), set(model2.index2word)):
-            all_words.append(word)
+    index = load_shared_vocab_index()
+    paths = get_models_paths()
+    for model1_path, model2_path in zip(paths, paths[1:]):
+        all_words.extend(get_shared_words(model1_path, model2_path, models, index))
     if ignore_duplicate_words:
         all_words = list(set(all_words))
-    vocab_pos = {}
-    for word in all_words:
-        pos = word.split('_')[1] if '_' in word else 'NONE'
-        vocab_pos[pos] = vocab_pos.get(pos, 0) + 1
-    return vocab_pos
+    return get_pos_count(all_words)
 
 
 def get_vocabularies() -> dict:
     """Returns a dictionary of model names and their vocabularies"""
     vocabularies = {}
     models = load_models()
-    for index in range(len(models) - 1):
-        model1 = models[get_models_paths()[index]]
-        model2 = models[get_models_paths()[index + 1]]
-        vocabularies[get_models_paths()[index]] = get_vocab_pos_count(model1, model2)
+    index = load_shared_vocab_index()
+    paths = get_models_paths()
+    for model1_path, model2_path in zip(paths, paths[1:]):
+        vocabularies[model1_path] = get_pos_count(get_shared_words(model1_path, model2_path, models, index))
     return vocabularies
 
 
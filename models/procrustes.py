@@ -1,34 +1,44 @@
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 import gensim
 import numpy as np
 
+if TYPE_CHECKING:
+    from models.shared_vocab import SharedVocabIndex
+
 
 def smart_procrustes_align_gensim(base_embed: gensim.models.KeyedVectors,
-                                  other_embed: gensim.models.KeyedVectors):
+                                  other_embed: gensim.models.KeyedVectors,
+                                  shared_rows: Optional[tuple] = None):
     """
     This code, taken from
     https://gist.github.com/quadrismegistus/09a93e219a6ffc4f216fb85235535faf and modified,
     uses procrustes analysis to make two word embeddings compatible.
     :param base_embed: first embedding
     :param other_embed: second embedding to be changed
+    :param shared_rows: (shared words, their rows in the base embedding, their rows in the other embedding),
+    e.g. as returned by SharedVocabIndex.shared_rows (see models/shared_vocab.py),
+    computed from the vocabularies if not given
     :return other_embed: changed embedding
     """
     base_embed.init_sims()
     other_embed.init_sims()
 
-    shared_vocab = list(
-        set(base_embed.vocab.keys()).intersection(other_embed.vocab.keys()))
+    if shared_rows is not None:
+        _, base_shared_indices, other_shared_indices = shared_rows
+    else:
+        shared_vocab = list(
+            set(base_embed.vocab.keys()).intersection(other_embed.vocab.keys()))
 
-    base_idx2word = {num: word for num, word in enumerate(base_embed.index2word)}
-    other_idx2word = {num: word for num, word in enumerate(other_embed.index2word)}
+        base_idx2word = {num: word for num, word in enumerate(base_embed.index2word)}
+        other_idx2word = {num: word for num, word in enumerate(other_embed.index2word)}
 
-    base_word2idx = {word: num for num, word in base_idx2word.items()}
-    other_word2idx = {word: num for num, word in other_idx2word.items()}
+        base_word2idx = {word: num for num, word in base_idx2word.items()}
+        other_word2idx = {word: num for num, word in other_idx2word.items()}
 
-    base_shared_indices = [base_word2idx[word] for word in
-                           shared_vocab]  # remember to remove tqdm
-    other_shared_indices = [other_word2idx[word] for word in
-                            shared_vocab]  # remember to remove tqdm
+        base_shared_indices = [base_word2idx[word] for word in
+                               shared_vocab]  # remember to remove tqdm
+        other_shared_indices = [other_word2idx[word] for word in
+                                shared_vocab]  # remember to remove tqdm
 
     base_vecs = base_embed.syn0norm
     other_vecs = other_embed.syn0norm
@@ -47,6 +57,78 @@ def smart_procrustes_align_gensim(base_embed: gensim.models.KeyedVectors,
     return other_embed
 
 
+def orthogonal_map(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Returns the orthogonal matrix that maps rows of source onto rows of target best"""
+    u, _, v = np.linalg.svd(source.T @ target)
+    return u @ v
+
+
+def chained_procrustes_align(embeds: dict, index: 'SharedVocabIndex') -> dict:
+    """
+    Aligns every embedding to the previous one in the dictionary (e.g. 2001 to 2000, 2002 to aligned 2001),
+    so each rotation is found on the large vocabulary shared by neighbouring years.
+    :param embeds: embeddings by their identifiers in the shared vocabulary index, in chain order
+    :param index: shared vocabulary index of the embeddings
+    :return embeds: changed embeddings
+    """
+    index = index.refreshed({identifier: embed.index2word for identifier, embed in embeds.items()})
+    identifiers = list(embeds)
+    for previous, current in zip(identifiers, identifiers[1:]):
+        _, previous_rows, current_rows = index.shared_rows(previous, current)
+        current_vecs = embeds[current].vectors_norm
+        ortho = orthogonal_map(current_vecs[current_rows], embeds[previous].vectors_norm[previous_rows])
+        embeds[current].vectors_norm = embeds[current].vectors = (current_vecs @ ortho).astype(np.float32)
+    return embeds
+
+
+def generalized_procrustes_align(embeds: dict, index: 'SharedVocabIndex', min_models: int = None,
+                                 iterations: int = 10, tolerance: float = 1e-4) -> dict:
+    """
+    Generalized procrustes analysis: iteratively rotates all embeddings to their common mean space.
+    The mean is taken over the words present in at least min_models embeddings (half of them by default),
+    starting from the embedding with the largest vocabulary.
+    Every iteration makes one SVD of a vector_size x vector_size matrix per embedding.
+    :param embeds: embeddings by their identifiers in the shared vocabulary index
+    :param index: shared vocabulary index of the embeddings
+    :param min_models: how many embeddings should have a word for it to be used
+    :param iterations: maximum number of iterations
+    :param tolerance: stop when rotations change less than this
+    :return embeds: changed embeddings
+    """
+    index = index.refreshed({identifier: embed.index2word for identifier, embed in embeds.items()})
+    identifiers = list(embeds)
+    rows = np.asarray(index.rows[[index.identifiers.index(identifier) for identifier in identifiers]])
+    present = rows >= 0
+    word_ids = np.flatnonzero(present.sum(axis=0) >= (min_models or (len(identifiers) + 1) // 2))
+    rows, present = rows[:, word_ids], present[:, word_ids]
+
+    vecs = [np.asarray(embeds[identifier].vectors_norm, dtype=np.float32) for identifier in identifiers]
+    shared_vecs = [vecs[number][rows[number, present[number]]] for number in range(len(identifiers))]
+
+    reference = int(np.argmax(present.sum(axis=1)))
+    mean = np.zeros((len(word_ids), vecs[0].shape[1]), dtype=np.float32)
+    mean[present[reference]] = shared_vecs[reference]
+    rotations = [orthogonal_map(shared_vecs[number], mean[present[number]]) if number != reference
+                 else np.eye(vecs[0].shape[1], dtype=np.float32) for number in range(len(identifiers))]
+
+    for _ in range(iterations):
+        mean[:] = 0
+        for number in range(len(identifiers)):
+            mean[present[number]] += shared_vecs[number] @ rotations[number]
+        mean /= np.linalg.norm(mean, axis=1, keepdims=True)
+
+        new_rotations = [orthogonal_map(shared_vecs[number], mean[present[number]])
+                         for number in range(len(identifiers))]
+        change = max(np.abs(new - old).max() for new, old in zip(new_rotations, rotations))
+        rotations = new_rotations
+        if change < tolerance:
+            break
+
+    for number, identifier in enumerate(identifiers):
+        embeds[identifier].vectors_norm = embeds[identifier].vectors = vecs[number] @ rotations[number]
+    return embeds
+
+
 class ProcrustesAligner(object):
     def __init__(self, w2v1: gensim.models.KeyedVectors, w2v2: gensim.models.KeyedVectors,
                  already_aligned=True):
@@ -65,7 +147,17 @@ class ProcrustesAligner(object):
         score = np.dot(vector1, vector2)  # More straightforward computation
         return score
 
-    def get_changes(self, top_n_changed_words: int, pos: Optional[str] = None):
+    def get_changes(self, top_n_changed_words: int, pos: Optional[str] = None,
+                    shared_rows: Optional[tuple] = None):
+        """
+        Returns top_n_changed_words shared words with the lowest similarity between the two models.
+        shared_rows are (shared words, their rows in the first model, their rows in the second model),
+        e.g. as returned by SharedVocabIndex.shared_rows, the shared words are found from the vocabularies if not given
+        """
+        if shared_rows is not None:
+            _, rows1, rows2 = shared_rows
+            return self._get_changes_from_rows(top_n_changed_words, pos, rows1, rows2)
+
         result = list()
         # their vocabs should be the same, so it doesn't matter over which to iterate:
         for word in set(self.w2v1.wv.vocab.keys()) & set(self.w2v2.wv.vocab.keys()):
@@ -77,6 +169,17 @@ class ProcrustesAligner(object):
         result = result[:top_n_changed_words]
         return result
 
+    def _get_changes_from_rows(self, top_n_changed_words: int, pos: Optional[str],
+                               rows1: np.ndarray, rows2: np.ndarray):
+        words = np.array(self.w2v1.wv.index2word)[rows1]
+        scores = np.einsum('ij,ij->i', self.w2v1.wv.vectors[rows1], self.w2v2.wv.vectors[rows2])
+        if pos is not None and pos.lower() != "all":
+            mask = np.char.endswith(words, "_" + pos)
+            words, scores = words[mask], scores[mask]
+
+        order = np.argsort(scores, kind='stable')[:top_n_changed_words]
+        return [(words[index].item(), scores[index]) for index in order]
+
 
 if __name__ == "__main__":
     pass
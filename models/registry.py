@@ -0,0 +1,108 @@
+"""Registry that loads models on first use and keeps only the recently used ones in memory"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Hashable, Iterable, Optional
+
+import numpy as np
+
+
+def is_memory_mapped(array: np.ndarray) -> bool:
+    """Checks if the array or the array it is a view of is memory-mapped"""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def get_model_bytes(model) -> int:
+    """
+    Returns the size of the vector matrices of the model in bytes.
+    Memory-mapped matrices are not counted: their pages live in the page cache
+    and are shared by processes, not held by the model.
+    """
+    arrays = {id(array): array for array in (getattr(model, 'vectors', None), getattr(model, 'vectors_norm', None))
+              if array is not None and not is_memory_mapped(array)}
+    return sum(array.nbytes for array in arrays.values())
+
+
+class ModelRegistry:
+    """
+    Dict-like storage of models that loads a model by its key on first access
+    and evicts the least recently used models when max_bytes is exceeded.
+    The model that was requested last and models pinned with pinned() are never evicted.
+    """
+    def __init__(self, loader: Callable[[Hashable], object], max_bytes: int,
+                 keys: Optional[Iterable[Hashable]] = None,
+                 on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.known_keys = list(keys) if keys is not None else None
+        self.on_evict = on_evict
+        self.loaded = OrderedDict()
+        self.sizes = {}
+        self.pins = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __repr__(self):
+        return f"ModelRegistry(loaded={list(self.loaded)}, bytes={self.loaded_bytes}, stats={self.stats})"
+
+    def __getitem__(self, key: Hashable):
+        if key in self.loaded:
+            self.stats['hits'] += 1
+            self.loaded.move_to_end(key)
+            return self.loaded[key]
+
+        if self.known_keys is not None and key not in self.known_keys:
+            raise KeyError(key)
+
+        self.stats['misses'] += 1
+        model = self.loader(key)
+        self.loaded[key] = model
+        self.sizes[key] = get_model_bytes(model)
+        self._evict()
+        return model
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.loaded
+
+    def __len__(self) -> int:
+        return len(self.known_keys) if self.known_keys is not None else len(self.loaded)
+
+    def keys(self) -> list:
+        """Returns the keys of all models that can be loaded"""
+        return list(self.known_keys) if self.known_keys is not None else list(self.loaded)
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def evict(self, key: Hashable) -> None:
+        """Removes the model from memory, it will be loaded again on the next access"""
+        del self.loaded[key]
+        del self.sizes[key]
+        self.stats['evictions'] += 1
+        if self.on_evict:
+            self.on_evict(key)
+
+    @contextmanager
+    def pinned(self, *keys: Hashable):
+        """Keeps the models in memory while in the block, e.g. all models of one query, even over max_bytes"""
+        for key in keys:
+            self.pins[key] = self.pins.get(key, 0) + 1
+        try:
+            yield self
+        finally:
+            for key in keys:
+                self.pins[key] -= 1
+                if not self.pins[key]:
+                    del self.pins[key]
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.loaded_bytes > self.max_bytes:
+            last_key = next(reversed(self.loaded), None)
+            key = next((key for key in self.loaded if key != last_key and key not in self.pins), None)
+            if key is None:
+                break
+            self.evict(key)
@@ -0,0 +1,147 @@
+"""Precomputed index of the vocabularies shared by the yearly models"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+
+def get_default_pairs(identifiers: list[str]) -> list[tuple[str, str]]:
+    """Returns consecutive pairs of identifiers and pairs of the first years with the last one"""
+    pairs = list(zip(identifiers, identifiers[1:]))
+    for identifier in ["2000", "2004"]:
+        if identifier in identifiers[:-1] and (identifier, identifiers[-1]) not in pairs:
+            pairs.append((identifier, identifiers[-1]))
+    return pairs
+
+
+def get_vocabulary_hash(words: list[str]) -> str:
+    """Returns a hash of the index2word list of a model, which changes when the model is retrained"""
+    return hashlib.sha1("\n".join(words).encode("utf-8")).hexdigest()
+
+
+def build_shared_vocab_index(vocabularies: dict[str, list[str]], output_dirpath: str | Path,
+                             pairs: list[tuple[str, str]] = None) -> None:
+    """
+    Builds the index from index2word lists of the models.
+    Saves a global word table, a matrix of row indices of every global word in every model
+    (-1 if the model does not have the word) and precomputed shared rows for the given pairs.
+    Sizes and hashes of the vocabularies are saved to detect a stale index (see SharedVocabIndex.matches).
+    Files are replaced atomically, so an index that is still open keeps reading the old ones.
+    """
+    output_dirpath = Path(output_dirpath)
+    identifiers = list(vocabularies.keys())
+    pairs = pairs if pairs is not None else get_default_pairs(identifiers)
+    shutil.rmtree(output_dirpath / "pairs", ignore_errors=True)
+    (output_dirpath / "pairs").mkdir(parents=True, exist_ok=True)
+
+    words = sorted(set().union(*vocabularies.values()))
+    word2id = {word: word_id for word_id, word in enumerate(words)}
+
+    rows = np.full((len(identifiers), len(words)), -1, dtype=np.int32)
+    for number, identifier in enumerate(identifiers):
+        word_ids = np.fromiter((word2id[word] for word in vocabularies[identifier]), dtype=np.int64,
+                               count=len(vocabularies[identifier]))
+        rows[number, word_ids] = np.arange(len(word_ids), dtype=np.int32)
+
+    with open(output_dirpath / "words.txt.tmp", "w", encoding="utf-8") as file:
+        file.write("\n".join(words))
+    os.replace(output_dirpath / "words.txt.tmp", output_dirpath / "words.txt")
+    with open(output_dirpath / "rows.npy.tmp", "wb") as file:
+        np.save(file, rows)
+    os.replace(output_dirpath / "rows.npy.tmp", output_dirpath / "rows.npy")
+    with open(output_dirpath / "identifiers.json.tmp", "w", encoding="utf-8") as file:
+        json.dump({"identifiers": identifiers,
+                   "sizes": [len(vocabularies[identifier]) for identifier in identifiers],
+                   "hashes": [get_vocabulary_hash(vocabularies[identifier]) for identifier in identifiers],
+                   "pairs": pairs}, file)
+    os.replace(output_dirpath / "identifiers.json.tmp", output_dirpath / "identifiers.json")
+
+    index = SharedVocabIndex(output_dirpath)
+    for identifier1, identifier2 in pairs:
+        np.save(output_dirpath / "pairs" / f"{identifier1}_{identifier2}.npy",
+                np.stack(index.shared_rows(identifier1, identifier2)))
+
+
+class SharedVocabIndex:
+    """Gives shared vocabulary and aligned row indices for any pair of the indexed models"""
+    def __init__(self, dirpath: str | Path):
+        self.dirpath = Path(dirpath)
+        with open(self.dirpath / "identifiers.json", "r", encoding="utf-8") as file:
+            info = json.load(file)
+        self.identifiers = info["identifiers"]
+        self.sizes = dict(zip(self.identifiers, info["sizes"]))
+        self.hashes = dict(zip(self.identifiers, info.get("hashes", [None] * len(self.identifiers))))
+        self.pairs = [tuple(pair) for pair in info["pairs"]] if "pairs" in info else None
+        with open(self.dirpath / "words.txt", "r", encoding="utf-8") as file:
+            self.words = file.read().split("\n")
+        self.rows = np.load(self.dirpath / "rows.npy", mmap_mode="r")
+        self._pairs = {}
+
+    def __repr__(self):
+        return f"SharedVocabIndex({self.dirpath})"
+
+    def matches(self, identifier: str, words: list[str]) -> bool:
+        """Checks that the index was built from this index2word list of the model"""
+        return self.sizes.get(identifier) == len(words) and self.hashes.get(identifier) == get_vocabulary_hash(words)
+
+    def vocabulary(self, identifier: str) -> list[str]:
+        """Returns the index2word list of the model the index was built from"""
+        rows = np.asarray(self.rows[self.identifiers.index(identifier)])
+        word_ids = np.flatnonzero(rows >= 0)
+        return [self.words[word_id] for word_id in word_ids[np.argsort(rows[word_ids])]]
+
+    def refreshed(self, vocabularies: dict[str, list[str]]) -> "SharedVocabIndex":
+        """
+        Returns this index if it was built from the given vocabularies of the models, otherwise rebuilds it
+        in the same directory (e.g. after the models were retrained) and returns the new index.
+        The given vocabularies replace or are added to the indexed ones, vocabularies of the other models
+        are taken from the index, so passing a subset of the models never drops the rest of them.
+        """
+        if all(self.matches(identifier, words) for identifier, words in vocabularies.items()):
+            return self
+        print(f"Shared vocabulary index {self.dirpath} does not match the models, rebuilding it...")
+        merged = {identifier: vocabularies[identifier] if identifier in vocabularies else self.vocabulary(identifier)
+                  for identifier in self.identifiers}
+        merged.update(vocabularies)
+        build_shared_vocab_index(merged, self.dirpath, self.pairs)
+        return SharedVocabIndex(self.dirpath)
+
+    def shared_rows(self, identifier1: str, identifier2: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns global ids of the shared words and their rows in the first and the second model"""
+        key = (identifier1, identifier2)
+        if key not in self._pairs:
+            pair_filepath = self.dirpath / "pairs" / f"{identifier1}_{identifier2}.npy"
+            if pair_filepath.exists():
+                self._pairs[key] = np.load(pair_filepath, mmap_mode="r")
+            else:
+                rows1 = self.rows[self.identifiers.index(identifier1)]
+                rows2 = self.rows[self.identifiers.index(identifier2)]
+                word_ids = np.flatnonzero((rows1 >= 0) & (rows2 >= 0)).astype(np.int32)
+                self._pairs[key] = np.stack([word_ids, rows1[word_ids], rows2[word_ids]])
+        word_ids, rows1, rows2 = self._pairs[key]
+        return word_ids, rows1, rows2
+
+    def shared_words(self, identifier1: str, identifier2: str) -> list[str]:
+        """Returns the words shared by two models"""
+        return [self.words[word_id] for word_id in self.shared_rows(identifier1, identifier2)[0]]
+
+
+if __name__ == "__main__":
+    import csv
+
+    from utils.utils import load_model
+    from constants import ROOT_PATH
+
+    with open(ROOT_PATH / "config.tsv", "r") as csvfile:
+        config = {row["identifier"]: row["path"] for row in csv.DictReader(csvfile, delimiter="\t")}
+
+    models_vocabularies = {}
+    for model_identifier, model_path in config.items():
+        print(f"Reading vocabulary of model {model_identifier}...")
+        models_vocabularies[model_identifier] = load_model(str(ROOT_PATH) + model_path).index2word
+
+    build_shared_vocab_index(models_vocabularies, ROOT_PATH / "models" / "shared_vocab_index")
+    print("Shared vocabulary index saved")
@@ -40,20 +40,86 @@ def format_time(time: float):
     return "{h}h {m}m {s:.2f}s".format(h=hours, m=minutes, s=seconds)
 
 
-def load_model(embeddings_file):
+def get_mmap_filepath(embeddings_file):
+    """
+    Returns the path of the memory-mapped copy of the model
+    (merged_2013_aligned.bin.gz -> merged_2013_aligned.npy)
+    """
+    for extension in ('.bin.gz', '.bin', '.txt.gz', '.txt', '.vec.gz', '.vec'):
+        if embeddings_file.endswith(extension):
+            return embeddings_file[:-len(extension)] + '.npy'
+    return embeddings_file + '.npy'
+
+
+def save_model_mmap(emb_model: gensim.models.KeyedVectors, output_file):
+    """
+    Saves the model in the memory-mapped format:
+    normalized float32 vectors as a raw .npy file
+    and a .vocab.tsv sidecar with words and their counts in the row order.
+    :param emb_model: the model to save
+    :param output_file: path to the .npy file
+    """
+    emb_model.init_sims()
+    np.save(output_file, emb_model.vectors_norm.astype(np.float32, copy=False))
+    with open(output_file[:-len('.npy')] + '.vocab.tsv', 'w', encoding='utf-8') as vocab_file:
+        for word in emb_model.index2word:
+            vocab_file.write('{word}\t{count}\n'.format(word=word, count=emb_model.vocab[word].count))
+
+
+class MmapKeyedVectors(gensim.models.KeyedVectors):
+    """
+    KeyedVectors over the read-only memory-mapped vectors saved by save_model_mmap.
+    The vectors are already normalized, so init_sims never computes or writes anything:
+    normalizing in place (replace=True) would fail on the read-only array.
+    Code that changes the vectors must assign new arrays instead of writing into them.
+    """
+    def init_sims(self, replace=False):
+        self.vectors_norm = self.vectors
+
+
+def load_model_mmap(embeddings_file):
+    """
+    Loads the model saved by save_model_mmap.
+    Vectors are opened with mmap_mode='r', so they are read lazily
+    and shared through the page cache by all processes using the model.
+    They are read-only and already normalized, see MmapKeyedVectors.
+    :param embeddings_file: path to the .npy file
+    :return: the loaded model with vectors and vectors_norm pointing to the same array
+    """
+    vectors = np.load(embeddings_file, mmap_mode='r')
+    emb_model = MmapKeyedVectors(vectors.shape[1])
+
+    with open(embeddings_file[:-len('.npy')] + '.vocab.tsv', 'r', encoding='utf-8') as vocab_file:
+        for index, line in enumerate(vocab_file):
+            word, count = line.rstrip('\n').rsplit('\t', 1)
+            emb_model.index2word.append(word)
+            emb_model.vocab[word] = gensim.models.word2vec.Vocab(index=index, count=int(count))
+
+    emb_model.vectors = emb_model.vectors_norm = vectors
+    return emb_model
+
+
+def load_model(embeddings_file, prefer_mmap: bool = False):
     """
     This function, written by github.com/akutuzov,
     unifies various standards of word embedding files.
     It automatically determines the format by the file extension
     and loads it from the disk correspondingly.
     :param embeddings_file: path to the file
+    :param prefer_mmap: load the memory-mapped copy of the model if it was converted
     :return: the loaded model
     """
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
+    if prefer_mmap and os.path.isfile(get_mmap_filepath(embeddings_file)):
+        embeddings_file = get_mmap_filepath(embeddings_file)
+
     if not os.path.isfile(embeddings_file):
         raise FileNotFoundError("No file called {file}".format(file=embeddings_file))
     # Determine the model format by the file extension
+    # Memory-mapped vectors, already normalized
+    if embeddings_file.endswith('.npy'):
+        return load_model_mmap(embeddings_file)
     # Binary word2vec file
     if embeddings_file.endswith('.bin.gz') or embeddings_file.endswith('.bin'):
         emb_model = gensim.models.KeyedVectors.load_word2vec_format(
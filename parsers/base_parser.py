@@ -1,25 +1,48 @@
 """Base parser that is parent to parsers for particular websites"""
 import asyncio
+import contextlib
 import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from io import StringIO
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 
-from parsers.saving_to_csv import save_to_csv, prepare_csv, does_file_exist, get_filename
-from parsers.url_fetcher import fetch
+from parsers.saving_to_csv import CsvWriter, prepare_csv, does_file_exist, does_progress_match, get_filename, \
+    read_progress
+from parsers.response_cache import ResponseCache
+from parsers.url_fetcher import Fetcher
 
 
 class BaseParser:
-    def __init__(self, base_url: str, parser_name: str, fieldnames: list, verbose: bool = False):
-        """Set main fields"""
+    def __init__(self, base_url: str, parser_name: str, fieldnames: list, verbose: bool = False,
+                 html_parser: str = "html.parser"):
+        """Set main fields. html_parser is the BeautifulSoup backend, e.g. 'html.parser' or 'lxml'."""
         self.verbose = verbose
+        self.html_parser = html_parser
         self.base_url = base_url
         self.fieldnames = fieldnames
         self.parser_name = parser_name
 
     async def run(self, start_date: str, end_date: str, day_limit: int, output_filename: str = "",
-                  concurrency_rate: int = 10, continue_database: bool = False) -> None:
-        """Scrapes and parses the website with given parameters"""
+                  concurrency_rate: int = 10, continue_database: bool = False, days_in_flight: int = 3,
+                  archive_concurrency: int = 0, parse_processes: Optional[int] = None, cache_filename: str = "",
+                  cache_max_age: Optional[float] = None, offline: bool = False, fetcher: Optional[Fetcher] = None,
+                  executor: Optional[ProcessPoolExecutor] = None,
+                  on_day_done: Optional[Callable[[str, datetime, int], None]] = None) -> None:
+        """Scrapes and parses the website with given parameters.
+
+        concurrency_rate bounds the number of articles fetched at once, days_in_flight bounds the
+        number of days being scraped at once and archive_concurrency bounds the number of archive
+        pages fetched at once (defaults to concurrency_rate). Html is parsed in a pool of
+        parse_processes processes (defaults to the number of CPUs), 0 parses inside the event loop.
+        Fetched pages are kept in the response cache at cache_filename, pages older than cache_max_age
+        seconds are revalidated, and offline replays the cached pages without using the network.
+
+        A fetcher and an executor may be passed to share them between several runs, then the cache
+        options are ignored and neither is closed here. on_day_done(parser_name, date, articles_count)
+        is called after each day is written.
+        """
         start_date = datetime.strptime(start_date, "%Y-%m-%d")
         current_date = start_date
         end_date = datetime.strptime(end_date, "%Y-%m-%d")
@@ -27,56 +50,130 @@ class BaseParser:
         if not output_filename:
             output_filename = get_filename(self.parser_name, start_date, end_date)
 
-        self._validate_run(start_date, end_date, output_filename, continue_database)
+        self._validate_run(start_date, end_date, output_filename, continue_database, cache_filename, offline)
 
         if continue_database:
-            current_date = self._read_last_dataset_date(output_filename) + timedelta(days=1)
+            current_date = self._resume_dataset(output_filename) + timedelta(days=1)
 
         if not continue_database:
             prepare_csv(output_filename, self.fieldnames)
 
-        while current_date <= end_date:
-            if self.verbose:
-                print(f"Processing {current_date.strftime('%Y-%m-%d')}")
-
-            archive_pages_urls = self._get_archive_pages_urls(current_date, day_limit)
-            archive_pages_htmls = []
-
-            for i in range(0, len(archive_pages_urls), concurrency_rate):
-                archive_pages_futures = [fetch(archive_page) for archive_page in archive_pages_urls[i:i + concurrency_rate]]
-                archive_pages_htmls += await asyncio.gather(*archive_pages_futures)
-
-            articles_urls = []
-
-            for archive_page_html in archive_pages_htmls:
-                articles_urls += self._find_articles(archive_page_html)
-
-            articles_urls = list(set(articles_urls))
-
-            if self.verbose:
-                print(f"Found {len(articles_urls)} articles")
-
-            articles_htmls = []
-
-            for i in range(0, len(articles_urls), concurrency_rate):
-                articles_futures = [fetch(article_url) for article_url in articles_urls[i:i + concurrency_rate]]
-                articles_htmls += await asyncio.gather(*articles_futures)
-
-            articles_info = []
-
-            for article_html in articles_htmls:
-                article_dict = self._parse_article_html(article_html)
-
-                if not article_dict:
-                    continue
-
-                article_dict["date"] = current_date.strftime("%Y/%m/%d")
-                articles_info.append(article_dict)
-
-            for article_dict in articles_info:
-                save_to_csv([article_dict], output_filename)
-
-            current_date += timedelta(days=1)
+        async with contextlib.AsyncExitStack() as stack:
+            writer = stack.enter_context(CsvWriter(output_filename, self.fieldnames))
+
+            if executor is None and parse_processes != 0:
+                executor = ProcessPoolExecutor(parse_processes)
+                stack.callback(executor.shutdown, cancel_futures=True)
+
+            if fetcher is None:
+                cache = stack.enter_context(ResponseCache(cache_filename, max_age=cache_max_age)) \
+                    if cache_filename else None
+                fetcher = await stack.enter_async_context(
+                    Fetcher(limit_per_host=concurrency_rate, cache=cache, offline=offline))
+                if self.verbose:
+                    stack.callback(lambda: print(fetcher.report()))
+
+            await self._run(fetcher, current_date, end_date, day_limit, writer, concurrency_rate, days_in_flight,
+                            archive_concurrency or concurrency_rate, executor, on_day_done)
+
+    async def _run(self, fetcher: Fetcher, current_date: datetime, end_date: datetime, day_limit: int,
+                   writer: CsvWriter, concurrency_rate: int, days_in_flight: int = 3,
+                   archive_concurrency: int = 10, executor: Optional[ProcessPoolExecutor] = None,
+                   on_day_done: Optional[Callable[[str, datetime, int], None]] = None) -> None:
+        """Scrape days from current_date to end_date using the fetcher.
+
+        The crawl is a pipeline of queues: a dispatcher hands out dates, archive workers turn a
+        date into article urls, article workers fetch and parse articles, and a writer appends
+        finished days to the csv and marks them completed. Days are written strictly in date order, so continuing a
+        database from its last date stays correct. A day holds its slot until it is written,
+        which bounds memory by days_in_flight. Html is parsed in the executor when one is given,
+        so parsing never blocks the fetches.
+        """
+        dates = [current_date + timedelta(days=i) for i in range((end_date - current_date).days + 1)]
+        days = {date: _Day() for date in dates}
+        day_slots = asyncio.Semaphore(days_in_flight)
+        archive_semaphore = asyncio.Semaphore(archive_concurrency)
+        date_queue = asyncio.Queue()
+        article_queue = asyncio.Queue(maxsize=concurrency_rate * 2)
+        loop = asyncio.get_running_loop()
+
+        async def parse(method, html):
+            # The bound method is pickled together with the parser, which is why the parser
+            # keeps no reference to the fetcher or other loop state.
+            if executor is None:
+                return method(html)
+            return await loop.run_in_executor(executor, method, html)
+
+        async def dispatch_dates():
+            # Slots are taken in date order by this single task, so the earliest unwritten day
+            # always gets one and the writer can never wait on a day that cannot start.
+            for date in dates:
+                await day_slots.acquire()
+                await date_queue.put(date)
+
+        async def fetch_archive_page(url):
+            async with archive_semaphore:
+                return await fetcher.fetch(url)
+
+        async def archive_worker():
+            while True:
+                date = await date_queue.get()
+                if self.verbose:
+                    print(f"Processing {date.strftime('%Y-%m-%d')}")
+
+                archive_pages_urls = self._get_archive_pages_urls(date, day_limit)
+                archive_pages_htmls = await asyncio.gather(*[fetch_archive_page(url) for url in archive_pages_urls])
+
+                articles_urls = []
+                for page_articles_urls in await asyncio.gather(*[parse(self._find_articles, archive_page_html)
+                                                                 for archive_page_html in archive_pages_htmls]):
+                    articles_urls += page_articles_urls
+                articles_urls = list(set(articles_urls))
+
+                if self.verbose:
+                    print(f"Found {len(articles_urls)} articles for {date.strftime('%Y-%m-%d')}")
+
+                days[date].expect(len(articles_urls))
+                for position, article_url in enumerate(articles_urls):
+                    await article_queue.put((date, position, article_url))
+
+        async def article_worker():
+            while True:
+                date, position, article_url = await article_queue.get()
+                article_html = await fetcher.fetch(article_url)
+                article_dict = await parse(self._parse_article_html, article_html)
+
+                if article_dict:
+                    article_dict["date"] = date.strftime("%Y/%m/%d")
+                days[date].add(position, article_dict)
+
+        async def write_days():
+            for date in dates:
+                day = days[date]
+                await day.done.wait()
+                articles_info = [article_dict for article_dict in day.articles if article_dict]
+                writer.writerows(articles_info)
+                writer.end_day(date)
+                if on_day_done is not None:
+                    on_day_done(self.parser_name, date, len(articles_info))
+
+                del days[date]
+                day_slots.release()
+
+        writer_task = asyncio.create_task(write_days())
+        tasks = {writer_task, asyncio.create_task(dispatch_dates())}
+        tasks.update(asyncio.create_task(archive_worker()) for _ in range(days_in_flight))
+        tasks.update(asyncio.create_task(article_worker()) for _ in range(concurrency_rate))
+
+        try:
+            while not writer_task.done():
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     def _get_archive_pages_urls(self, date: datetime, page_count: int) -> list:
         """Find or generate archive pages for a given date."""
@@ -90,7 +187,27 @@ class BaseParser:
         """Parse article html and return dict with article title, text, topic and subtopic."""
         pass
 
+    def _resume_dataset(self, filename: str) -> datetime:
+        """Prepare the dataset to be continued and return its last completed date.
+
+        If the progress sidecar written by CsvWriter matches the file, rows written after the last completed
+        date belong to an unfinished day and are cut off.
+        """
+        progress = read_progress(filename)
+        if progress is not None:
+            if does_progress_match(filename, progress):
+                os.truncate(filename, progress.offset)
+            else:
+                print(f"Progress of {filename} does not match the file, continuing after its last row")
+        return self._read_last_dataset_date(filename)
+
     def _read_last_dataset_date(self, filename: str) -> datetime:
+        """Return the last completed date of the dataset from the progress sidecar if it matches the file,
+        otherwise the date of the last row."""
+        progress = read_progress(filename)
+        if progress is not None and does_progress_match(filename, progress):
+            return progress.date
+
         with open(filename, 'r', encoding='utf-8') as file:
             for line in file:
                 pass
@@ -103,8 +220,11 @@ class BaseParser:
             return datetime.strptime(date, "%Y/%m/%d")
 
     def _validate_run(self, start_date: datetime, end_date: datetime, output_filename: str = "",
-                      continue_database: bool = False):
+                      continue_database: bool = False, cache_filename: str = "", offline: bool = False):
         """Validate run configuration."""
+        if offline and not cache_filename:
+            raise ValueError("Offline mode needs a cache file.")
+
         if end_date > datetime.now():
             raise ValueError("End date is in the future.")
 
@@ -125,4 +245,25 @@ class BaseParser:
             raise ValueError("Fieldnames must have 'date' column.")
 
         if 'text' not in self.fieldnames:
-            raise ValueError("Fieldnames must have 'text' column.")
\ No newline at end of file
+            raise ValueError("Fieldnames must have 'text' column.")
+
+
+class _Day:
+    """Articles of one day collected by the crawl pipeline, kept in archive order."""
+
+    def __init__(self):
+        self.articles = []
+        self.pending = None
+        self.done = asyncio.Event()
+
+    def expect(self, count: int) -> None:
+        self.articles = [None] * count
+        self.pending = count
+        if not count:
+            self.done.set()
+
+    def add(self, position: int, article_dict: Dict[str, str]) -> None:
+        self.articles[position] = article_dict
+        self.pending -= 1
+        if not self.pending:
+            self.done.set()
@@ -0,0 +1,84 @@
+"""
+Benchmark of html parsing backends and of parsing in a process pool on saved Kommersant pages:
+the archive page is parsed with _find_articles, an article page with _parse_article_html.
+Usage: python benchmark_parsing.py [article.html [archive.html]]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from download_kommersant import KommersantParser
+
+
+HTML_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "index.html")
+ARTICLE_HTML_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "article.html")
+BACKENDS = ("html.parser", "lxml")
+
+
+def time_serial(method, html: str, repeats: int) -> float:
+    """Return pages per second of parsing html repeats times in this process."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        method(html)
+    return repeats / (time.perf_counter() - start)
+
+
+def time_pool(method, html: str, repeats: int, processes: int) -> float:
+    """Return pages per second of parsing html repeats times in a process pool."""
+    with ProcessPoolExecutor(processes) as executor:
+        list(executor.map(method, [html] * processes))  # warm up the workers
+
+        start = time.perf_counter()
+        list(executor.map(method, [html] * repeats, chunksize=1))
+        return repeats / (time.perf_counter() - start)
+
+
+def read_html(html_filepath: str) -> str:
+    with open(html_filepath, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def benchmark_method(method_name: str, html: str, repeats: int, processes: int) -> None:
+    """Print pages per second of the parser method for every backend and check that backends agree."""
+    reference_result = None
+
+    for backend in BACKENDS:
+        method = getattr(KommersantParser(verbose=False, html_parser=backend), method_name)
+
+        result = method(html)
+        if reference_result is None:
+            reference_result = result
+        elif result != reference_result:
+            print(f"{backend}: {method_name} result differs from {BACKENDS[0]}")
+
+        serial = time_serial(method, html, repeats)
+        pool = time_pool(method, html, repeats * processes, processes)
+        print(f"{backend:12} {method_name}: {serial:8.1f} pages/s serial, "
+              f"{pool:8.1f} pages/s in {processes} processes")
+
+
+def run_benchmark(article_html_filepath: str = ARTICLE_HTML_FILEPATH, html_filepath: str = HTML_FILEPATH,
+                  repeats: int = 50, processes: int = None) -> None:
+    """
+    Benchmark _find_articles on the archive page and _parse_article_html on the article page,
+    a saved https://www.kommersant.ru/doc/... page. The article page is skipped if it was not saved.
+    """
+    processes = processes or os.cpu_count()
+
+    benchmark_method("_find_articles", read_html(html_filepath), repeats, processes)
+
+    if not os.path.isfile(article_html_filepath):
+        print(f"No article page {article_html_filepath}, save a Kommersant article page there "
+              f"to benchmark _parse_article_html")
+        return
+
+    article_html = read_html(article_html_filepath)
+    if not KommersantParser(verbose=False)._parse_article_html(article_html):
+        print(f"{article_html_filepath} is not a Kommersant article page")
+        return
+    benchmark_method("_parse_article_html", article_html, repeats, processes)
+
+
+if __name__ == "__main__":
+    run_benchmark(*sys.argv[1:3])
@@ -8,9 +8,9 @@ from bs4 import BeautifulSoup
 
 
 class KommersantParser(BaseParser):
-    def __init__(self, verbose: bool):
+    def __init__(self, verbose: bool, html_parser: str = 'html.parser'):
         super().__init__(base_url="https://www.kommersant.ru", parser_name='kommersant',
-                         fieldnames=['date', 'title', 'text', 'topic'], verbose=verbose)
+                         fieldnames=['date', 'title', 'text', 'topic'], verbose=verbose, html_parser=html_parser)
 
     def _get_archive_pages_urls(self, date: datetime, page_count: int) -> list:
         archive_urls = []
@@ -21,14 +21,14 @@ class KommersantParser(BaseParser):
         return archive_urls
 
     def _find_articles(self, html: str) -> List[str]:
-        doc_tree = BeautifulSoup(html, 'html.parser')
+        doc_tree = BeautifulSoup(html, self.html_parser)
         news_list = doc_tree.find("div", {"class": "rubric_lenta"})
         if not news_list:
             return []
         return [f"{self.base_url}{link['href']}" for link in news_list.find_all('a') if 'doc/' in link.get('href', '')]
 
     def _parse_article_html(self, html: str) -> Dict[str, str]:
-        doc_tree = BeautifulSoup(html, 'html.parser')
+        doc_tree = BeautifulSoup(html, self.html_parser)
 
         title = doc_tree.find("h1", {"class": "doc_header__name js-search-mark"})
         title = title.get_text().strip() if title else None
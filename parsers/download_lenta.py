@@ -10,9 +10,10 @@ from bs4 import BeautifulSoup
 
 
 class LentaParser(BaseParser):
-    def __init__(self, verbose: bool = False):
+    def __init__(self, verbose: bool = False, html_parser: str = 'html.parser'):
         super().__init__(base_url="https://lenta.ru/news/", parser_name='lenta',
-                       fieldnames=["date", "title", "text", "topic", "subtopic"], verbose=verbose)
+                       fieldnames=["date", "title", "text", "topic", "subtopic"], verbose=verbose,
+                       html_parser=html_parser)
 
     def _get_archive_pages_urls(self, date: datetime, page_count: int) -> list:
         """Find archive pages for a given date."""
@@ -23,13 +24,13 @@ class LentaParser(BaseParser):
 
     def _find_articles(self, html: str) -> List[str]:
         """Find all links to https://lenta.ru articles on the page and return list of links to them."""
-        doc_tree = BeautifulSoup(html, 'html.parser')
+        doc_tree = BeautifulSoup(html, self.html_parser)
         news_list = doc_tree.find_all("a", "card-full-news _archive")
         return list(set(f"https://lenta.ru{news['href']}" for news in news_list))
 
     def _parse_article_html(self, html: str) -> Dict[str, str]:
         """Parse article html and return dict with article title, text, topic and subtopic."""
-        doc_tree = BeautifulSoup(html, 'html.parser')
+        doc_tree = BeautifulSoup(html, self.html_parser)
 
         body = doc_tree.find_all("p", {"class": "topic-body__content-text"})
 
@@ -0,0 +1,131 @@
+"""Runs parsers of several websites over yearly date shards in one event loop with per-host limits"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from download_kommersant import KommersantParser
+from download_lenta import LentaParser
+
+from parsers.response_cache import ResponseCache
+from parsers.saving_to_csv import does_file_exist, get_filename, read_progress
+from parsers.url_fetcher import Fetcher, HostLimiter
+
+
+# (concurrent requests, requests per second) for each host
+HOST_LIMITS = {
+    "lenta.ru": (2, 4.0),
+    "www.kommersant.ru": (15, 20.0),
+}
+
+
+class CrawlJob(NamedTuple):
+    parser: object
+    start_date: datetime
+    end_date: datetime
+    day_limit: int
+    concurrency_rate: int
+
+
+def shard_by_year(start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime]]:
+    """Split the date range into ranges that do not cross a year boundary."""
+    shards = []
+    while start_date <= end_date:
+        shard_end = min(datetime(start_date.year, 12, 31), end_date)
+        shards.append((start_date, shard_end))
+        start_date = datetime(start_date.year + 1, 1, 1)
+    return shards
+
+
+def get_crawl_jobs(parsers: List[Tuple[object, int, int]], start_date: str, end_date: str) -> List[CrawlJob]:
+    """Create a job for every parser and yearly shard. parsers holds (parser, day_limit, concurrency_rate)."""
+    start_date = datetime.strptime(start_date, "%Y-%m-%d")
+    end_date = datetime.strptime(end_date, "%Y-%m-%d")
+    return [CrawlJob(parser, shard_start, shard_end, day_limit, concurrency_rate)
+            for shard_start, shard_end in shard_by_year(start_date, end_date)
+            for parser, day_limit, concurrency_rate in parsers]
+
+
+def can_continue_shard(filename: str) -> bool:
+    """Check whether the shard file has completed days. A file with only the header is removed."""
+    if not does_file_exist(filename):
+        return False
+    if read_progress(filename) is not None:
+        return True
+
+    with open(filename, "r", encoding='utf-8') as file:
+        next(file, None)
+        has_rows = next(file, None) is not None
+    if not has_rows:
+        os.remove(filename)
+    return has_rows
+
+
+class CrawlProgress:
+    """Counts completed days and articles of all jobs and prints the progress every interval seconds."""
+    def __init__(self, total_days: int, interval: float = 60.0):
+        self.total_days = total_days
+        self.interval = interval
+        self.days = {}
+        self.articles = {}
+        self.start_time = time.monotonic()
+        self.last_report = self.start_time
+
+    def day_done(self, parser_name: str, date: datetime, articles_count: int) -> None:
+        self.days[parser_name] = self.days.get(parser_name, 0) + 1
+        self.articles[parser_name] = self.articles.get(parser_name, 0) + articles_count
+        if time.monotonic() - self.last_report >= self.interval:
+            self.last_report = time.monotonic()
+            print(self.report())
+
+    def report(self) -> str:
+        days_done = sum(self.days.values())
+        elapsed = time.monotonic() - self.start_time
+        parsers = ", ".join(f"{name}: {self.days[name]} days, {self.articles[name]} articles" for name in self.days)
+        return (f"Days: {days_done}/{self.total_days}, {days_done / max(elapsed, 1e-9) * 3600:.0f} days/hour "
+                f"({parsers})")
+
+
+async def run_crawl_jobs(jobs: List[CrawlJob], host_limits: Dict[str, Tuple[int, Optional[float]]] = None,
+                         jobs_in_flight: int = 8, days_in_flight: int = 3, parse_processes: Optional[int] = None,
+                         cache_filename: str = "", offline: bool = False) -> None:
+    """
+    Run jobs concurrently in this event loop, at most jobs_in_flight at once. All jobs share one fetcher,
+    whose per-host limiters keep every website within its budget however many jobs crawl it, and one
+    process pool for parsing. Each shard is written to its own file and is continued if the file exists.
+    """
+    host_limits = HOST_LIMITS if host_limits is None else host_limits
+    limiters = {host: HostLimiter(concurrency, rate) for host, (concurrency, rate) in host_limits.items()}
+    progress = CrawlProgress(sum((job.end_date - job.start_date).days + 1 for job in jobs))
+    job_slots = asyncio.Semaphore(jobs_in_flight)
+    cache = ResponseCache(cache_filename) if cache_filename else None
+
+    async def run_job(job: CrawlJob, fetcher: Fetcher, executor: ProcessPoolExecutor):
+        async with job_slots:
+            output_filename = get_filename(job.parser.parser_name, job.start_date, job.end_date)
+            await job.parser.run(job.start_date.strftime("%Y-%m-%d"), job.end_date.strftime("%Y-%m-%d"),
+                                 job.day_limit, output_filename, concurrency_rate=job.concurrency_rate,
+                                 continue_database=can_continue_shard(output_filename),
+                                 days_in_flight=days_in_flight, fetcher=fetcher, executor=executor,
+                                 on_day_done=progress.day_done)
+
+    limit_per_host = max([concurrency for concurrency, _ in host_limits.values()], default=10)
+
+    try:
+        with ProcessPoolExecutor(parse_processes) as executor:
+            async with Fetcher(limit_per_host=limit_per_host, cache=cache, offline=offline,
+                               host_limits=limiters) as fetcher:
+                await asyncio.gather(*[run_job(job, fetcher, executor) for job in jobs])
+                print(fetcher.report())
+    finally:
+        print(progress.report())
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    parsers = [(LentaParser(), 10, 2), (KommersantParser(verbose=False), 10, 15)]
+    asyncio.run(run_crawl_jobs(get_crawl_jobs(parsers, "2000-01-01", "2022-12-31"),
+                               cache_filename="responses_cache.sqlite"))
@@ -0,0 +1,107 @@
+"""On-disk cache of fetched pages, used to re-crawl and re-parse websites without downloading them again"""
+import sqlite3
+import time
+import zlib
+from typing import NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+class ResponseCache:
+    """
+    Stores zlib-compressed response bodies in SQLite by url, together with status, ETag, Last-Modified
+    and fetch time. Responses older than max_age seconds are revalidated, by default they never expire.
+    Writes are committed in batches of commit_every changes or after commit_interval seconds and on close,
+    so the event loop does not wait for a commit on every page.
+    """
+    def __init__(self, filename: str, max_age: Optional[float] = None, compression_level: int = 6,
+                 commit_every: int = 100, commit_interval: float = 10.0):
+        self.filename = filename
+        self.max_age = max_age
+        self.compression_level = compression_level
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0}
+
+        self.connection = sqlite3.connect(filename, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, status INTEGER NOT NULL, "
+                                "body BLOB NOT NULL, etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for the url or None."""
+        row = self.connection.execute("SELECT status, body, etag, last_modified, fetched_at FROM responses "
+                                      "WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        status, body, etag, last_modified, fetched_at = row
+        return CachedResponse(status, zlib.decompress(body), etag, last_modified, fetched_at)
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        """Check whether the response can be served without revalidation."""
+        return self.max_age is None or time.time() - response.fetched_at < self.max_age
+
+    def conditional_headers(self, response: CachedResponse) -> dict:
+        """Return headers for a conditional request that revalidates the response."""
+        headers = {}
+        if response.etag:
+            headers["If-None-Match"] = response.etag
+        if response.last_modified:
+            headers["If-Modified-Since"] = response.last_modified
+        return headers
+
+    def put(self, url: str, status: int, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO responses (url, status, body, etag, last_modified, fetched_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                (url, status, zlib.compress(body, self.compression_level), etag, last_modified,
+                                 time.time()))
+        self.stats["stored"] += 1
+        self._changed()
+
+    def touch(self, url: str) -> None:
+        """Mark the cached response as fresh after the server confirmed it is unchanged."""
+        self.connection.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+        self.stats["revalidated"] += 1
+        self._changed()
+
+    def _changed(self) -> None:
+        self.pending += 1
+        if self.pending >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """Commit the pending writes."""
+        self.connection.commit()
+        self.pending = 0
+        self.last_commit = time.monotonic()
+
+    def report(self) -> str:
+        return (f"Cache hits: {self.stats['hits']}, misses: {self.stats['misses']}, "
+                f"revalidated: {self.stats['revalidated']}, stored: {self.stats['stored']}")
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
@@ -1,11 +1,24 @@
 """Saving to csv file."""
 import csv
 from datetime import datetime
+import hashlib
+import json
 import os
-from typing import Dict, List
+import time
+from typing import Dict, List, NamedTuple, Optional
 from pathlib import Path
 
 
+# Number of bytes before the recorded offset that are hashed to recognize the file in the progress sidecar
+FINGERPRINT_SIZE = 4096
+
+
+class Progress(NamedTuple):
+    date: datetime
+    offset: int
+    fingerprint: Optional[str]
+
+
 def get_filename(parser_name: str, start_date: datetime, end_date: datetime) -> str:
     """Create a filename to save data"""
     return f"{parser_name}_dataset/{parser_name}-{start_date.strftime('%Y-%m-%d')}-to-" \
@@ -26,6 +39,49 @@ def prepare_csv(filename: str | Path, fieldnames: list) -> None:
         writer = csv.DictWriter(file, fieldnames=fieldnames)
         writer.writeheader()
 
+    if os.path.exists(get_progress_filename(filename)):
+        os.remove(get_progress_filename(filename))
+
+
+def get_progress_filename(filename: str | Path) -> str:
+    """Return the name of the sidecar file with the last completed date of the csv file"""
+    return f"{filename}.progress"
+
+
+def get_fingerprint(filename: str | Path, offset: int) -> str:
+    """Return the hash of the last FINGERPRINT_SIZE bytes of the file before offset"""
+    with open(filename, "rb") as file:
+        file.seek(max(0, offset - FINGERPRINT_SIZE))
+        return hashlib.sha1(file.read(offset - file.tell())).hexdigest()
+
+
+def read_progress(filename: str | Path) -> Optional[Progress]:
+    """Return the last completed date, the csv file size at that date and its fingerprint, or None if there
+    is no sidecar. The fingerprint is None in sidecars written before it was recorded."""
+    progress_filename = get_progress_filename(filename)
+    if not os.path.exists(progress_filename):
+        return None
+
+    with open(progress_filename, "r", encoding='utf-8') as file:
+        progress = json.load(file)
+    return Progress(datetime.strptime(progress["date"], "%Y/%m/%d"), progress["offset"], progress.get("fingerprint"))
+
+
+def write_progress(filename: str | Path, date: datetime, offset: int) -> None:
+    """Record the completed date with the file size and the fingerprint of the file at that size."""
+    progress_filename = get_progress_filename(filename)
+    with open(f"{progress_filename}.tmp", "w", encoding='utf-8') as file:
+        json.dump({"date": date.strftime("%Y/%m/%d"), "offset": offset,
+                   "fingerprint": get_fingerprint(filename, offset)}, file)
+    os.replace(f"{progress_filename}.tmp", progress_filename)
+
+
+def does_progress_match(filename: str | Path, progress: Progress) -> bool:
+    """Check that the file still starts with the content the progress was recorded for, i.e. it was only
+    appended to since then"""
+    return (progress.fingerprint is not None and os.path.getsize(filename) >= progress.offset
+            and get_fingerprint(filename, progress.offset) == progress.fingerprint)
+
 
 def save_to_csv(articles_dict: List[Dict[str, str]], filename: str | Path, fieldnames: list = None,
                 create_new_file: bool = False) -> None:
@@ -46,3 +102,54 @@ def save_to_csv(articles_dict: List[Dict[str, str]], filename: str | Path, field
             writer.writeheader()
         for article_dict in articles_dict:
             writer.writerow(article_dict)
+
+
+class CsvWriter:
+    """
+    Appends rows to a csv file through one open file. Rows are buffered and written when buffer_size rows
+    are collected or flush_interval seconds have passed. end_day makes the written rows durable and records
+    the completed date in a sidecar file, see read_progress.
+    """
+    def __init__(self, filename: str | Path, fieldnames: list = None, buffer_size: int = 1000,
+                 flush_interval: float = 30.0):
+        if not fieldnames:
+            with open(filename, "r", encoding='utf-8') as file:
+                fieldnames = csv.DictReader(file).fieldnames
+
+        self.filename = filename
+        self.fieldnames = fieldnames
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.file = open(filename, "a", encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def writerows(self, articles_dict: List[Dict[str, str]]) -> None:
+        self.buffer.extend(articles_dict)
+        if len(self.buffer) >= self.buffer_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered rows to the file."""
+        self.writer.writerows(self.buffer)
+        self.buffer = []
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def end_day(self, date: datetime) -> None:
+        """Write all rows of the day to disk and record the day as completed."""
+        self.flush()
+        os.fsync(self.file.fileno())
+        write_progress(self.filename, date, os.fstat(self.file.fileno()).st_size)
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
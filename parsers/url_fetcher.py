@@ -1,23 +1,143 @@
 """"""
+import asyncio
+import contextlib
+import random
 import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
 
 import aiohttp
 from aiohttp import client_exceptions
 
 from headers_generation import get_headers
+from parsers.response_cache import ResponseCache
+
+
+class HostLimiter:
+    """Bounds the number of concurrent requests to one host and spaces their starts by 1 / rate seconds."""
+    def __init__(self, concurrency: int, rate: Optional[float] = None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1 / rate if rate else 0.0
+        self.next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+        return self
+
+    async def __aexit__(self, *args):
+        self.semaphore.release()
+
+
+class Fetcher:
+    """
+    Fetches pages through one pooled session, retries failed requests and counts statistics.
+    With a cache, cached pages are served without a request, stale ones are revalidated with a conditional
+    request, and in offline mode only cached pages are served. Only successful responses are cached. Requests to hosts in host_limits go through
+    their HostLimiter, so one fetcher can be shared by parsers of different websites.
+    """
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, retries: int = 3, backoff: float = 5.0,
+                 jitter: float = 2.0, timeout: float = 60.0, cache: Optional[ResponseCache] = None,
+                 offline: bool = False, host_limits: Optional[Dict[str, HostLimiter]] = None):
+        """Set connection limits, retry policy, timeout in seconds, response cache and per-host limits"""
+        if offline and cache is None:
+            raise ValueError("Offline mode needs a response cache.")
+
+        self.cache = cache
+        self.offline = offline
+        self.host_limits = host_limits or {}
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.session = None
+        self.stats = {"requests": 0, "errors": 0, "retries": 0, "bytes": 0, "latency": 0.0}
+        self.start_time = time.monotonic()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                         ttl_dns_cache=300, keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(connector=connector, headers=get_headers(),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.start_time = time.monotonic()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+
+    async def fetch(self, url: str) -> str:
+        """Fetch the page, return empty string if it could not be fetched."""
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and cached.status != 200:
+            cached = None  # error responses of older caches are fetched again
+        if cached is not None and (self.offline or self.cache.is_fresh(cached)):
+            self.cache.stats["hits"] += 1
+            return cached.text
+        if self.offline:
+            return ""
+
+        headers = self.cache.conditional_headers(cached) if cached is not None else None
+        limiter = self.host_limits.get(urlparse(url).hostname) or contextlib.nullcontext()
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) + random.uniform(0, self.jitter))
+
+            start_time = time.monotonic()
+            try:
+                async with limiter:
+                    start_time = time.monotonic()
+                    async with self.session.get(url, allow_redirects=False, headers=headers) as response:
+                        if response.status in (429, 500, 502, 503, 504):
+                            print(f"Error for {url}: ", response.status)
+                            continue
+                        if response.status == 304 and cached is not None:
+                            self.cache.touch(url)
+                            return cached.text
+                        if response.status != 200:
+                            print(f"Error for {url}: ", response.status)
+                            self.stats["errors"] += 1
+                            return ""
+
+                        body = await response.read()
+                        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            except (client_exceptions.ClientError, asyncio.TimeoutError) as error:
+                print(f"Error for {url}: ", type(error).__name__)
+                continue
+            finally:
+                self.stats["requests"] += 1
+                self.stats["latency"] += time.monotonic() - start_time
+
+            self.stats["bytes"] += len(body)
+            if self.cache is not None:
+                self.cache.put(url, 200, body, etag, last_modified)
+            return body.decode("utf-8", errors="replace")
+
+        self.stats["errors"] += 1
+        return ""
+
+    def report(self) -> str:
+        """Return latency and throughput statistics."""
+        elapsed = time.monotonic() - self.start_time
+        requests = self.stats["requests"]
+        cache_report = f", {self.cache.report()}" if self.cache is not None else ""
+        return (f"Requests: {requests}, errors: {self.stats['errors']}, retries: {self.stats['retries']}, "
+                f"average latency: {self.stats['latency'] / max(requests, 1):.2f}s, "
+                f"throughput: {requests / max(elapsed, 1e-9):.1f} requests/s, "
+                f"{self.stats['bytes'] / max(elapsed, 1e-9) / 1024:.1f} KB/s{cache_report}")
 
 
 async def fetch(url: str) -> str:
     """Fetch the page."""
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=get_headers(), allow_redirects=False) as response:
-                if response.status != 200:
-                    print(f"Error for {url}: ", response.status)
-                    return ""
-
-                return await response.text(encoding="utf-8")
-        except aiohttp.client_exceptions.ClientConnectorError:
-            print(f"Error for {url}: ", "Connection refused")
-            time.sleep(15)
-            return ""
+    async with Fetcher(retries=0) as fetcher:
+        return await fetcher.fetch(url)
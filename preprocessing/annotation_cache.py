@@ -0,0 +1,75 @@
+"""Кэш результатов UDPipe на диске, ключ – хэш нормализованного текста и версии модели"""
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+
+def get_udpipe_model_version(udpipe_filename: str | Path) -> str:
+    """
+    :return: хэш файла модели UDPipe, чтобы кэш не использовался после замены модели
+    """
+    file_hash = hashlib.sha1()
+    with open(udpipe_filename, 'rb') as model_file:
+        for block in iter(lambda: model_file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class AnnotationCache:
+    """
+    Хранит последовательности лемм с тэгами для текстов, уже обработанных UDPipe, в SQLite.
+    Ключ – sha1 от версии модели, параметров обработки и результата unify_sym
+    """
+    def __init__(self, filename: str | Path, model_version: str, keep_pos: bool = True, keep_punct: bool = False):
+        self.filename = filename
+        self.prefix = f'{model_version}\0{keep_pos}\0{keep_punct}\0'.encode('utf-8')
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(str(filename), timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS annotations (key BLOB PRIMARY KEY, output TEXT NOT NULL)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(self.prefix + text.encode('utf-8')).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[str]]:
+        """
+        :return: сохранённые результаты для текстов, None для текстов, которых нет в кэше
+        """
+        keys = [self.key(text) for text in texts]
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = 'SELECT key, output FROM annotations WHERE key IN (%s)' % ','.join('?' * len(chunk))
+            found.update(self.connection.execute(query, chunk).fetchall())
+
+        outputs = [found.get(key) for key in keys]
+        misses = outputs.count(None)
+        self.misses += misses
+        self.hits += len(outputs) - misses
+        return outputs
+
+    def put_many(self, texts: List[str], outputs: List[str]) -> None:
+        self.connection.executemany('INSERT OR REPLACE INTO annotations (key, output) VALUES (?, ?)',
+                                    [(self.key(text), output) for text, output in zip(texts, outputs)])
+        self.connection.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def report(self) -> str:
+        return f'Cache hits: {self.hits}, misses: {self.misses}, hit rate: {self.hit_rate:.1%}'
+
+    def close(self) -> None:
+        self.connection.close()
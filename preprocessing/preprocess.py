@@ -1,8 +1,10 @@
 from __future__ import print_function
 from __future__ import division
-from multiprocessing import Process
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import sys
 import csv
+import json
 from pathlib import Path
 
 import os
@@ -13,6 +15,8 @@ import re
 from ufal.udpipe import Model, Pipeline
 
 from constants import ROOT_PATH
+from dataset_utils.article_store import is_article_store, read_texts
+from preprocessing.annotation_cache import AnnotationCache, get_udpipe_model_version
 
 csv.field_size_limit(sys.maxsize)
 '''
@@ -69,145 +73,245 @@ def list_replace(search, replacement, text):
     return text
 
 
-def unify_sym(text):  # принимает строку в юникоде
-    text = list_replace \
-        ('\u00AB\u00BB\u2039\u203A\u201E\u201A\u201C\u201F\u2018\u201B\u201D\u2019', '\u0022', text)
-
-    text = list_replace \
-        ('\u2012\u2013\u2014\u2015\u203E\u0305\u00AF', '\u2003\u002D\u002D\u2003', text)
-
-    text = list_replace('\u2010\u2011', '\u002D', text)
-
-    text = list_replace \
-            (
-            '\u2000\u2001\u2002\u2004\u2005\u2006\u2007\u2008\u2009\u200A\u200B\u202F\u205F\u2060\u3000',
-            '\u2002', text)
-
-    text = re.sub('\u2003\u2003', '\u2003', text)
-    text = re.sub('\t\t', '\t', text)
+UNIFY_REPLACEMENTS = [
+    ('\u00AB\u00BB\u2039\u203A\u201E\u201A\u201C\u201F\u2018\u201B\u201D\u2019', '\u0022'),
+    ('\u2012\u2013\u2014\u2015\u203E\u0305\u00AF', '\u2003\u002D\u002D\u2003'),
+    ('\u2010\u2011', '\u002D'),
+    ('\u2000\u2001\u2002\u2004\u2005\u2006\u2007\u2008\u2009\u200A\u200B\u202F\u205F\u2060\u3000', '\u2002'),
+    ('\u02CC\u0307\u0323\u2022\u2023\u2043\u204C\u204D\u2219\u25E6\u00B7\u00D7\u22C5\u2219\u2062', '.'),
+    ('\u2217', '\u002A'),
+    ('…', '...'),
+    ('\u2241\u224B\u2E2F\u0483', '\u223D'),
+    ('\u00C4', 'A'),  # латинская
+    ('\u00E4', 'a'),
+    ('\u00CB', 'E'),
+    ('\u00EB', 'e'),
+    ('\u1E26', 'H'),
+    ('\u1E27', 'h'),
+    ('\u00CF', 'I'),
+    ('\u00EF', 'i'),
+    ('\u00D6', 'O'),
+    ('\u00F6', 'o'),
+    ('\u00DC', 'U'),
+    ('\u00FC', 'u'),
+    ('\u0178', 'Y'),
+    ('\u00FF', 'y'),
+    ('\u00DF', 's'),
+    ('\u1E9E', 'S'),
+]
+
+CURRENCIES = '\u20BD\u0024\u00A3\u20A4\u20AC\u20AA\u2133\u20BE\u00A2\u058F\u0BF9\u20BC\u20A1\u20A0\u20B4\u20A7\u20B0\u20BF\u20A3\u060B\u0E3F\u20A9\u20B4\u20B2\u0192\u20AB\u00A5\u20AD\u20A1\u20BA\u20A6\u20B1\uFDFC\u17DB\u20B9\u20A8\u20B5\u09F3\u20B8\u20AE\u0192'
+
+ALPHABET = '\t\n\r абвгдеёзжийклмнопрстуфхцчшщьыъэюяАБВГДЕЁЗЖИЙКЛМНОПРСТУФХЦЧШЩЬЫЪЭЮЯ,.[]{}()=+-−*&^%$#@!~;:0123456789§/\\|"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ\u00A0\''
+
+
+NOT_ALLOWED_RE = re.compile('[^%s]+' % ''.join(re.escape(sym) for sym in sorted(set(CURRENCIES + ALPHABET))))
+TABS_RE = re.compile('\t\t')
+
+
+class UnifyTable(dict):
+    """Таблица для str.translate, удаляющая символы, которых в ней нет"""
+    def __missing__(self, key):
+        return None
 
-    text = list_replace \
-            (
-            '\u02CC\u0307\u0323\u2022\u2023\u2043\u204C\u204D\u2219\u25E6\u00B7\u00D7\u22C5\u2219\u2062',
-            '.', text)
 
-    text = list_replace('\u2217', '\u002A', text)
+def build_unify_table(replacements: List[tuple]) -> UnifyTable:
+    """
+    Собирает таблицу замен для недопустимых символов. Заменённые символы не встречаются среди заменяемых дальше,
+    поэтому одна таблица даёт тот же результат, что и последовательные замены.
+    Из замен сразу удаляются недопустимые символы (например, \u2003 вокруг тире)
+    """
+    table = UnifyTable()
+    for search, replacement in replacements:
+        for sym in search:
+            table.setdefault(ord(sym), NOT_ALLOWED_RE.sub('', replacement))
+    return table
 
-    text = list_replace('…', '...', text)
 
-    text = list_replace('\u2241\u224B\u2E2F\u0483', '\u223D', text)
+UNIFY_TABLE = build_unify_table(UNIFY_REPLACEMENTS)
 
-    text = list_replace('\u00C4', 'A', text)  # латинская
-    text = list_replace('\u00E4', 'a', text)
-    text = list_replace('\u00CB', 'E', text)
-    text = list_replace('\u00EB', 'e', text)
-    text = list_replace('\u1E26', 'H', text)
-    text = list_replace('\u1E27', 'h', text)
-    text = list_replace('\u00CF', 'I', text)
-    text = list_replace('\u00EF', 'i', text)
-    text = list_replace('\u00D6', 'O', text)
-    text = list_replace('\u00F6', 'o', text)
-    text = list_replace('\u00DC', 'U', text)
-    text = list_replace('\u00FC', 'u', text)
-    text = list_replace('\u0178', 'Y', text)
-    text = list_replace('\u00FF', 'y', text)
-    text = list_replace('\u00DF', 's', text)
-    text = list_replace('\u1E9E', 'S', text)
 
-    currencies = list \
-            (
-            '\u20BD\u0024\u00A3\u20A4\u20AC\u20AA\u2133\u20BE\u00A2\u058F\u0BF9\u20BC\u20A1\u20A0\u20B4\u20A7\u20B0\u20BF\u20A3\u060B\u0E3F\u20A9\u20B4\u20B2\u0192\u20AB\u00A5\u20AD\u20A1\u20BA\u20A6\u20B1\uFDFC\u17DB\u20B9\u20A8\u20B5\u09F3\u20B8\u20AE\u0192'
-        )
+def unify_not_allowed(match):
+    return match.group().translate(UNIFY_TABLE)
 
-    alphabet = list \
-            (
-            '\t\n\r абвгдеёзжийклмнопрстуфхцчшщьыъэюяАБВГДЕЁЗЖИЙКЛМНОПРСТУФХЦЧШЩЬЫЪЭЮЯ,.[]{}()=+-−*&^%$#@!~;:0123456789§/\|"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ ')
 
-    alphabet.append("'")
+def unify_sym(text):  # принимает строку в юникоде
+    # замены не создают и не удаляют табуляции, поэтому их можно схлопнуть до замен,
+    # но обязательно до удаления недопустимых символов, стоящих между ними
+    text = TABS_RE.sub('\t', text)
+    # все заменяемые символы недопустимы, поэтому замены и удаление делаются за один проход
+    # по последовательностям недопустимых символов
+    return NOT_ALLOWED_RE.sub(unify_not_allowed, text)
 
-    allowed = set(currencies + alphabet)
 
-    cleaned_text = [sym for sym in text if sym in allowed]
-    cleaned_text = ''.join(cleaned_text)
+# Отдельный абзац с этим словом разделяет документы при пакетной обработке
+DOCUMENT_SEPARATOR = 'xxdocumentseparatorxx'
 
-    return cleaned_text
 
+def parse_conllu(processed):
+    """
+    :param processed: вывод UDPipe в формате conllu
+    :return: список токенов, каждый токен – список из 10 полей conllu
+    """
+    tokens = []
+    for line in processed.split('\n'):
+        # пропускаем пустые строки и строки со служебной информацией
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        if len(fields) == 10:
+            tokens.append(fields)
+    return tokens
 
-def process(pipeline, text='Строка', keep_pos=True, keep_punct=False):
-    # Если частеречные тэги не нужны (например, их нет в модели), выставьте pos=False
-    # в этом случае на выход будут поданы только леммы
-    # По умолчанию знаки пунктуации вырезаются. Чтобы сохранить их, выставьте punct=True
 
-    entities = {'PROPN'}
+def tag_tokens(tokens, keep_pos=True, keep_punct=False):
+    """
+    Извлекает из токенов conllu леммы с тэгами, объединяя идущие подряд имена собственные
+    в одном падеже и числе
+    """
     named = False
     memory = []
     mem_case = None
     mem_number = None
     tagged_propn = []
 
-    # обрабатываем текст, получаем результат в формате conllu:
-    processed = pipeline.process(text)
-
-    # пропускаем строки со служебной информацией:
-    content = [l for l in processed.split('\n') if not l.startswith('#')]
-
-    # извлекаем из обработанного текста леммы, тэги и морфологические характеристики
-    tagged = [w.split('\t') for w in content if w]
-
-    for t in tagged:
-        if len(t) != 10:
-            continue
-        (word_id, token, lemma, pos, xpos, feats, head, deprel, deps, misc) = t
+    for t in tokens:
+        token, lemma, pos, feats, misc = t[1], t[2], t[3], t[5], t[9]
         token = clean_token(token, misc)
         lemma = clean_lemma(lemma, pos)
         if not lemma or not token:
             continue
-        if pos in entities:
+        if pos == 'PROPN':
             if '|' not in feats:
-                tagged_propn.append('%s_%s' % (lemma, pos))
+                tagged_propn.append((lemma, pos))
                 continue
-            morph = {el.split('=')[0]: el.split('=')[1] for el in feats.split('|')}
-            if 'Case' not in morph or 'Number' not in morph:
-                tagged_propn.append('%s_%s' % (lemma, pos))
+            case = number = None
+            for feature in feats.split('|'):
+                name, _, value = feature.partition('=')
+                if name == 'Case':
+                    case = value
+                elif name == 'Number':
+                    number = value
+            if case is None or number is None:
+                tagged_propn.append((lemma, pos))
                 continue
             if not named:
                 named = True
-                mem_case = morph['Case']
-                mem_number = morph['Number']
-            if morph['Case'] == mem_case and morph['Number'] == mem_number:
+                mem_case = case
+                mem_number = number
+            if case == mem_case and number == mem_number:
                 memory.append(lemma)
                 if 'SpacesAfter=\\n' in misc or 'SpacesAfter=\s\\n' in misc:
                     named = False
-                    past_lemma = '::'.join(memory)
+                    tagged_propn.append(('::'.join(memory), 'PROPN'))
                     memory = []
-                    tagged_propn.append(past_lemma + '_PROPN')
             else:
                 named = False
-                past_lemma = '::'.join(memory)
+                tagged_propn.append(('::'.join(memory), 'PROPN'))
                 memory = []
-                tagged_propn.append(past_lemma + '_PROPN')
-                tagged_propn.append('%s_%s' % (lemma, pos))
+                tagged_propn.append((lemma, pos))
         else:
             if not named:
                 if pos == 'NUM' and token.isdigit():  # Заменяем числа на xxxxx той же длины
                     lemma = num_replace(token)
-                tagged_propn.append('%s_%s' % (lemma, pos))
+                tagged_propn.append((lemma, pos))
             else:
                 named = False
-                past_lemma = '::'.join(memory)
+                tagged_propn.append(('::'.join(memory), 'PROPN'))
                 memory = []
-                tagged_propn.append(past_lemma + '_PROPN')
-                tagged_propn.append('%s_%s' % (lemma, pos))
+                tagged_propn.append((lemma, pos))
 
     if not keep_punct:
-        tagged_propn = [word for word in tagged_propn if word.split('_')[1] != 'PUNCT']
+        tagged_propn = [(lemma, pos) for lemma, pos in tagged_propn if pos != 'PUNCT']
     if not keep_pos:
-        tagged_propn = [word.split('_')[0] for word in tagged_propn]
-    return tagged_propn
+        return [lemma for lemma, pos in tagged_propn]
+    return ['%s_%s' % (lemma, pos) for lemma, pos in tagged_propn]
 
 
-def preprocess_text_file(input_filename: str | Path, output_filename: str | Path, is_multiprocessed: bool = False) -> None:
-    print(f"Preprocessing {input_filename}...")
+def process(pipeline, text='Строка', keep_pos=True, keep_punct=False):
+    # Если частеречные тэги не нужны (например, их нет в модели), выставьте pos=False
+    # в этом случае на выход будут поданы только леммы
+    # По умолчанию знаки пунктуации вырезаются. Чтобы сохранить их, выставьте punct=True
+
+    # обрабатываем текст, получаем результат в формате conllu:
+    processed = pipeline.process(text)
+    return tag_tokens(parse_conllu(processed), keep_pos=keep_pos, keep_punct=keep_punct)
+
+
+def end_of_text_misc(misc):
+    """
+    :return: поле MISC последнего токена документа таким, каким оно было бы без следующего документа.
+    В конце текста UDPipe записывает в SpacesAfter оставшиеся пробелы и перевод строки
+    (SpacesAfter=\\n, SpacesAfter=\\s\\s\\n), перед разделителем документов перевод строки двойной
+    (SpacesAfter=\\n\\n, SpacesAfter=\\s\\s\\n\\n), лишний убирается. Пробелы в конце текста
+    сохраняются, поэтому тексты не нужно обрезать иначе, чем для process
+    """
+    features = misc.split('|')
+    for index, feature in enumerate(features):
+        if feature.startswith('SpacesAfter=') and feature.endswith('\\n\\n'):
+            features[index] = feature[:-len('\\n')]
+    return '|'.join(features)
+
+
+def process_batch(pipeline, texts, keep_pos=True, keep_punct=False):
+    """
+    Обрабатывает несколько документов одним вызовом UDPipe. Документы разделяются абзацем
+    с DOCUMENT_SEPARATOR, а у последнего токена каждого документа поле MISC восстанавливается
+    как при отдельной обработке, поэтому результат совпадает с process для каждого документа.
+    Если разделитель встречается в самих текстах или документов после разбиения получилось
+    не столько, сколько текстов, пакет обрабатывается по одному документу
+    :return: список результатов process для каждого документа
+    """
+    if any(DOCUMENT_SEPARATOR in text for text in texts):
+        return [process(pipeline, text, keep_pos=keep_pos, keep_punct=keep_punct) for text in texts]
+
+    processed = pipeline.process(('\n\n%s\n\n' % DOCUMENT_SEPARATOR).join(texts))
+
+    documents = [[]]
+    for t in parse_conllu(processed):
+        if t[1] == DOCUMENT_SEPARATOR:
+            if documents[-1]:
+                documents[-1][-1][9] = end_of_text_misc(documents[-1][-1][9])
+            documents.append([])
+        else:
+            documents[-1].append(t)
+
+    if len(documents) != len(texts):
+        return [process(pipeline, text, keep_pos=keep_pos, keep_punct=keep_punct) for text in texts]
+
+    return [tag_tokens(tokens, keep_pos=keep_pos, keep_punct=keep_punct) for tokens in documents]
+
+
+def preprocess_texts(pipeline, texts, cache: AnnotationCache = None, udpipe_batch_size: int = 50):
+    """
+    :param texts: тексты после unify_sym
+    :param cache: кэш результатов, обрабатываются только тексты, которых в нём нет
+    :return: строки из лемм с тэгами через пробел для каждого текста
+    """
+    outputs = cache.get_many(texts) if cache else [None] * len(texts)
+    missing = [index for index, output in enumerate(outputs) if output is None]
+
+    for start in range(0, len(missing), udpipe_batch_size):
+        indices = missing[start:start + udpipe_batch_size]
+        batch_outputs = [' '.join(output) for output in process_batch(pipeline, [texts[index] for index in indices])]
+        if cache:
+            cache.put_many([texts[index] for index in indices], batch_outputs)
+        for index, output in zip(indices, batch_outputs):
+            outputs[index] = output
+
+    return outputs
+
+
+def open_annotation_cache(cache_filename: str | Path = None):
+    """
+    :return: кэш результатов для текущей модели UDPipe или None, если файл кэша не задан
+    """
+    if not cache_filename:
+        return None
+    return AnnotationCache(cache_filename, get_udpipe_model_version(download_udpipe_model()))
+
+
+def download_udpipe_model() -> str:
     # URL of the UDPipe model
     udpipe_model_url = 'https://rusvectores.org/static/models/udpipe_syntagrus.model'
     udpipe_filename = udpipe_model_url.split('/')[-1]
@@ -216,34 +320,206 @@ def preprocess_text_file(input_filename: str | Path, output_filename: str | Path
         print('UDPipe model not found. Downloading...')
         wget.download(udpipe_model_url)
 
+    return udpipe_filename
+
+
+def load_udpipe_pipeline():
+    """
+    :return: модель UDPipe и конвейер для неё (модель нужно хранить, пока используется конвейер)
+    """
+    udpipe_filename = download_udpipe_model()
+
     print('Loading the model...')
     model = Model.load(udpipe_filename)
     process_pipeline = Pipeline(model, 'tokenize', Pipeline.DEFAULT, Pipeline.DEFAULT, 'conllu')
+    return model, process_pipeline
 
-    print('Processing input...')
-    with open(input_filename, 'r', encoding='utf-8') as input_file:
-        preprocessed_lines = []
-        lines = []
 
+def read_input_lines(input_filename: str | Path):
+    """
+    :param input_filename: .csv с колонкой text, хранилище статей (см. dataset_utils/article_store.py)
+    или текстовый файл
+    :return: генератор строк входного файла
+    """
+    if is_article_store(input_filename):
+        yield from read_texts(input_filename)
+        return
+
+    with open(input_filename, 'r', encoding='utf-8') as input_file:
         if str(input_filename).endswith('.csv'):
             reader = csv.DictReader(input_file, delimiter=',', quotechar='"')
             for row in reader:
-                lines.append(row['text'])
+                yield row['text']
         else:
-            lines = input_file.readlines()
+            yield from input_file
+
+
+def read_checkpoint(checkpoint_filename: str | Path) -> tuple:
+    """
+    :return: количество обработанных строк входного файла и размер выходного файла в байтах
+    """
+    if not os.path.isfile(checkpoint_filename):
+        return 0, 0
+    with open(checkpoint_filename, 'r', encoding='utf-8') as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    return checkpoint['rows'], checkpoint['offset']
+
+
+def write_checkpoint(checkpoint_filename: str | Path, rows: int, offset: int) -> None:
+    with open(f'{checkpoint_filename}.tmp', 'w', encoding='utf-8') as checkpoint_file:
+        json.dump({'rows': rows, 'offset': offset}, checkpoint_file)
+    os.replace(f'{checkpoint_filename}.tmp', checkpoint_filename)
+
 
-        for line in lines:
-            res = unify_sym(line.strip())
-            output = process(process_pipeline, text=res)
-            preprocessed_lines.append(' '.join(output))
+def preprocess_text_file(input_filename: str | Path, output_filename: str | Path, is_multiprocessed: bool = False,
+                         batch_size: int = 1000, udpipe_batch_size: int = 50,
+                         cache_filename: str | Path = None) -> None:
+    """
+    Обрабатывает файл потоково: строки читаются по одной и передаются в UDPipe пачками
+    по udpipe_batch_size строк, результаты дописываются в выходной файл пачками по batch_size строк.
+    После каждой записи сохраняется контрольная точка (<output_filename>.checkpoint),
+    с которой прерванная обработка продолжится при следующем запуске.
+    Если задан cache_filename, уже обработанные тексты берутся из кэша (см. annotation_cache.py).
+    """
+    print(f"Preprocessing {input_filename}...")
+    model, process_pipeline = load_udpipe_pipeline()
+    cache = open_annotation_cache(cache_filename)
+
+    checkpoint_filename = f'{output_filename}.checkpoint'
+    rows_done, offset = read_checkpoint(checkpoint_filename) if os.path.isfile(output_filename) else (0, 0)
+    if rows_done:
+        print(f'Continuing from line {rows_done}...')
+
+    print('Processing input...')
+    with open(output_filename, 'r+b' if rows_done else 'wb') as output_file:
+        output_file.truncate(offset)
+        output_file.seek(offset)
+        preprocessed_lines = []
+
+        def write_lines() -> None:
+            nonlocal rows_done
+            output_file.write((('\n' if rows_done else '') + '\n'.join(preprocessed_lines)).encode('utf-8'))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+            rows_done += len(preprocessed_lines)
+            write_checkpoint(checkpoint_filename, rows_done, output_file.tell())
+            preprocessed_lines.clear()
+
+        def process_lines() -> None:
+            lines_before = rows_done + len(preprocessed_lines)
+            preprocessed_lines.extend(preprocess_texts(process_pipeline, [unify_sym(line.strip()) for line in lines],
+                                                       cache, udpipe_batch_size))
+            lines.clear()
+            lines_processed = rows_done + len(preprocessed_lines)
             if is_multiprocessed:
-                if len(preprocessed_lines) % 1000 == 0:
-                    print(f'{input_filename} – lines processed: {len(preprocessed_lines)} / {len(lines)}')
+                if lines_processed // 1000 > lines_before // 1000:
+                    print(f'{input_filename} – lines processed: {lines_processed}')
             else:
-                print(f'\rLines processed: {len(preprocessed_lines)} / {len(lines)}', end=''"")
+                print(f'\rLines processed: {lines_processed}', end=''"")
+
+        lines = []
+        for row_number, line in enumerate(read_input_lines(input_filename)):
+            if row_number < rows_done:
+                continue
+            lines.append(line)
+            if len(lines) == udpipe_batch_size:
+                process_lines()
+
+            if len(preprocessed_lines) >= batch_size:
+                write_lines()
+
+        if lines:
+            process_lines()
+        if preprocessed_lines:
+            write_lines()
 
-    with open(output_filename, 'w', encoding='utf-8') as output_file:
-        output_file.write('\n'.join(preprocessed_lines))
+    if os.path.isfile(checkpoint_filename):
+        os.remove(checkpoint_filename)
+
+    if cache:
+        print(cache.report())
+        cache.close()
+
+
+_worker = {}
+
+
+def _init_worker(cache_filename: str | Path = None) -> None:
+    _worker['model'], _worker['pipeline'] = load_udpipe_pipeline()
+    _worker['cache'] = open_annotation_cache(cache_filename)
+
+
+def _preprocess_lines(lines: List[str]) -> tuple:
+    cache = _worker['cache']
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    outputs = preprocess_texts(_worker['pipeline'], [unify_sym(line.strip()) for line in lines], cache)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return outputs, hits, misses
+
+
+def _read_chunks(input_filename: str | Path, chunk_size: int):
+    chunk = []
+    for line in read_input_lines(input_filename):
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def preprocess_text_files(filenames: List[tuple], processes: int = None, chunk_size: int = 500,
+                          cache_filename: str | Path = None) -> None:
+    """
+    Обрабатывает несколько файлов пулом процессов. Входные файлы делятся на куски по chunk_size строк,
+    которые раздаются свободным процессам, поэтому все ядра заняты до последнего куска.
+    Каждый процесс загружает модель UDPipe один раз, результаты записываются в исходном порядке.
+    :param filenames: пары (входной файл, выходной файл)
+    :param processes: количество процессов (по умолчанию – количество ядер)
+    :param chunk_size: количество строк в одном задании
+    :param cache_filename: файл кэша результатов UDPipe (см. annotation_cache.py)
+    """
+    download_udpipe_model()
+    processes = processes or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(cache_filename,)) as executor:
+        pending = deque()
+        output_file = None
+        written_lines = 0
+        cache_hits = cache_misses = 0
+
+        def write_ready(max_pending: int) -> None:
+            nonlocal output_file, written_lines, cache_hits, cache_misses
+            while len(pending) > max_pending:
+                kind, value = pending.popleft()
+                if kind == 'open':
+                    print(f"Preprocessing {value[0]}...")
+                    output_file = open(value[1], 'w', encoding='utf-8')
+                    written_lines = 0
+                elif kind == 'close':
+                    output_file.close()
+                    print(f"{value[1]} – lines processed: {written_lines}")
+                else:
+                    lines, hits, misses = value.result()
+                    cache_hits, cache_misses = cache_hits + hits, cache_misses + misses
+                    for line in lines:
+                        output_file.write(('\n' if written_lines else '') + line)
+                        written_lines += 1
+
+        for input_filename, output_filename in filenames:
+            pending.append(('open', (input_filename, output_filename)))
+            for chunk in _read_chunks(input_filename, chunk_size):
+                pending.append(('chunk', executor.submit(_preprocess_lines, chunk)))
+                write_ready(processes * 2)
+            pending.append(('close', (input_filename, output_filename)))
+
+        write_ready(0)
+
+    if cache_filename:
+        print(f'Cache hits: {cache_hits}, misses: {cache_misses}, '
+              f'hit rate: {cache_hits / max(cache_hits + cache_misses, 1):.1%}')
 
 
 def divide_csv_file_into_chunks(input_filename: str | Path, chunks_amount: int = 7) -> None:
@@ -273,35 +549,6 @@ if __name__ == "__main__":
 
 
     raise Exception
-    processes = []
-    for year in range(2011, 2023):
-        p = Process(target=preprocess_text_file,
-                    args=(ROOT_PATH / 'datasets' / 'merged_dataset' / f'merged_{year}.csv',
-                          ROOT_PATH / 'datasets' / 'merged_dataset' / f'merged_{year}_preprocessed_2.txt',
-                          True))
-        processes.append(p)
-
-    processes[0].start()
-    processes[1].start()
-    processes[2].start()
-    processes[3].start()
-    processes[4].start()
-    processes[5].start()
-    processes[6].start()
-    processes[7].start()
-    processes[8].start()
-    processes[9].start()
-    processes[10].start()
-    processes[11].start()
-    processes[0].join()
-    processes[1].join()
-    processes[2].join()
-    processes[3].join()
-    processes[4].join()
-    processes[5].join()
-    processes[6].join()
-    processes[7].join()
-    processes[8].join()
-    processes[9].join()
-    processes[10].join()
-    processes[11].join()
+    preprocess_text_files([(ROOT_PATH / 'datasets' / 'merged_dataset' / f'merged_{year}.csv',
+                            ROOT_PATH / 'datasets' / 'merged_dataset' / f'merged_{year}_preprocessed_2.txt')
+                           for year in range(2011, 2023)])
@@ -0,0 +1,119 @@
+"""Корпус в виде номеров токенов: общий словарь лемм с тэгами и массивы uint32 для каждого года"""
+from array import array
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def build_token_corpus(text_filepaths: dict, output_dirpath: str | Path, buffer_size: int = 1 << 22) -> None:
+    """
+    Переводит обработанные тексты (леммы с тэгами через пробел, предложение на строку) в номера токенов.
+    Для каждого года сохраняются tokens_<год>.u32 – номера токенов подряд и offsets_<год>.i64 – начала
+    предложений и конец последнего, общий словарь – в vocab.txt
+    :param text_filepaths: файлы обработанных текстов по годам
+    :param output_dirpath: папка корпуса
+    :param buffer_size: сколько номеров токенов держать в памяти перед записью
+    """
+    output_dirpath = Path(output_dirpath)
+    output_dirpath.mkdir(parents=True, exist_ok=True)
+
+    word2id = {}
+    meta = {'years': {}}
+
+    for year, text_filepath in text_filepaths.items():
+        print(f'Converting {text_filepath}...')
+        tokens = array('I')
+        offsets = array('q', [0])
+        written = 0
+
+        with open(text_filepath, 'r', encoding='utf-8') as text_file, \
+                open(output_dirpath / f'tokens_{year}.u32', 'wb') as tokens_file:
+            for line in text_file:
+                for word in line.split():
+                    word_id = word2id.get(word)
+                    if word_id is None:
+                        word_id = word2id[word] = len(word2id)
+                    tokens.append(word_id)
+                offsets.append(written + len(tokens))
+                if len(tokens) >= buffer_size:
+                    tokens.tofile(tokens_file)
+                    written += len(tokens)
+                    tokens = array('I')
+            tokens.tofile(tokens_file)
+
+        with open(output_dirpath / f'offsets_{year}.i64', 'wb') as offsets_file:
+            offsets.tofile(offsets_file)
+        meta['years'][str(year)] = {'tokens': offsets[-1], 'sentences': len(offsets) - 1}
+
+    with open(output_dirpath / 'vocab.txt', 'w', encoding='utf-8') as vocab_file:
+        vocab_file.write('\n'.join(word2id))
+    with open(output_dirpath / 'meta.json', 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
+
+
+class YearSentences:
+    """Перезапускаемый итератор предложений одного года в виде списков слов (для gensim)"""
+    def __init__(self, corpus, year):
+        self.corpus = corpus
+        self.year = year
+
+    def __iter__(self):
+        words = self.corpus.words_array
+        tokens = self.corpus.tokens(self.year)
+        offsets = self.corpus.offsets(self.year)
+        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            yield words[tokens[start:end]].tolist()
+
+
+class TokenCorpus:
+    """Чтение корпуса, сохранённого build_token_corpus; массивы открываются через np.memmap"""
+    def __init__(self, dirpath: str | Path):
+        self.dirpath = Path(dirpath)
+        with open(self.dirpath / 'meta.json', 'r', encoding='utf-8') as meta_file:
+            self.meta = json.load(meta_file)
+        with open(self.dirpath / 'vocab.txt', 'r', encoding='utf-8') as vocab_file:
+            self.words = vocab_file.read().split('\n')
+        self.words_array = np.array(self.words, dtype=object)
+
+    def __repr__(self):
+        return f'TokenCorpus({self.dirpath})'
+
+    @property
+    def years(self) -> list:
+        return list(self.meta['years'])
+
+    def tokens(self, year) -> np.ndarray:
+        if not self.meta['years'][str(year)]['tokens']:
+            return np.zeros(0, dtype=np.uint32)
+        return np.memmap(self.dirpath / f'tokens_{year}.u32', dtype=np.uint32, mode='r')
+
+    def offsets(self, year) -> np.ndarray:
+        return np.memmap(self.dirpath / f'offsets_{year}.i64', dtype=np.int64, mode='r')
+
+    def sentence_count(self, year) -> int:
+        return self.meta['years'][str(year)]['sentences']
+
+    def sentences(self, year) -> YearSentences:
+        return YearSentences(self, year)
+
+    def counts(self, year) -> np.ndarray:
+        """
+        :return: частоты всех слов общего словаря в корпусе года
+        """
+        return np.bincount(self.tokens(year), minlength=len(self.words))
+
+    def word_counts(self, year, min_count: int = 1) -> dict:
+        """
+        :return: словарь частот слов, встретившихся в корпусе года не меньше min_count раз
+        """
+        counts = self.counts(year)
+        return {self.words[word_id]: int(counts[word_id]) for word_id in np.flatnonzero(counts >= min_count)}
+
+
+if __name__ == '__main__':
+    from constants import ROOT_PATH
+
+    build_token_corpus({year: ROOT_PATH / 'datasets' / 'merged_dataset' / f'merged_{year}_preprocessed.txt'
+                        for year in range(2000, 2023)},
+                       ROOT_PATH / 'datasets' / 'token_corpus')
@@ -0,0 +1,22 @@
+"""Checks that the table-driven unify_sym gives the same output as the original chain of replacements"""
+import json
+
+from constants import ROOT_PATH
+from preprocessing.preprocess import unify_sym
+
+
+# Inputs with the outputs of unify_sym before it was made table-driven
+UNIFY_SYM_CASES_FILEPATH = ROOT_PATH / "preprocessing" / "unify_sym_cases.json"
+
+
+def test_unify_sym_matches_old_implementation():
+    with open(UNIFY_SYM_CASES_FILEPATH, "r", encoding='utf-8') as file:
+        cases = json.load(file)
+
+    mismatches = [case for case in cases if unify_sym(case["input"]) != case["output"]]
+    assert not mismatches, f"{len(mismatches)} of {len(cases)} cases differ, first: {mismatches[0]!r}"
+
+
+if __name__ == "__main__":
+    test_unify_sym_matches_old_implementation()
+    print("unify_sym matches the old implementation")